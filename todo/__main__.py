@@ -0,0 +1,29 @@
+import argparse
+import os
+import sys
+
+'''
+Command line entry point, run from the repository root:
+    python -m todo serve --workers 4      - multi process server, check serve.py
+Modules of the app import each other from this folder (like on render, where root directory is 'todo') and templates and
+static files are found relative to it, so this folder is put on sys.path and made the working directory first.
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog = 'python -m todo')
+    parser.add_argument('command', choices = ['serve'])
+    parser.add_argument('arguments', nargs = argparse.REMAINDER)
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+
+    import serve
+    serve.main(args.arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""create todo stats update trigger
+
+Revision ID: 3c8e5a1f7b94
+Revises: e41b7c2d9f08
+Create Date: 2026-10-18 18:40:12.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8e5a1f7b94'
+down_revision: Union[str, Sequence[str], None] = 'e41b7c2d9f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PRIORITIES = range(1, 6)
+
+
+def flag_change(condition: str) -> str:
+    return f"(CASE WHEN new.{condition} THEN 1 ELSE 0 END) - (CASE WHEN old.{condition} THEN 1 ELSE 0 END)"
+
+
+# must stay the same as models.TODO_STATS_DDL
+CHANGES = {'completed': flag_change('complete'), **{f'priority_{priority}': flag_change(f'priority = {priority}') for priority in PRIORITIES}}
+UPSERT = (f"INSERT INTO todo_stats (owner_id, {', '.join(CHANGES)}) VALUES (new.owner_id, {', '.join(CHANGES.values())}) "
+          f"ON CONFLICT (owner_id) DO UPDATE SET " + ', '.join(f'{counter} = todo_stats.{counter} + excluded.{counter}' for counter in CHANGES))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        op.execute(f"CREATE OR REPLACE FUNCTION todo_stats_update() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                   f"BEGIN {UPSERT}; RETURN NULL; END $$")
+        op.execute("DROP TRIGGER IF EXISTS todo_stats_update ON todos")
+        op.execute("CREATE TRIGGER todo_stats_update AFTER UPDATE OF complete, priority ON todos FOR EACH ROW "
+                   "WHEN (old.complete IS DISTINCT FROM new.complete OR old.priority IS DISTINCT FROM new.priority) "
+                   "EXECUTE FUNCTION todo_stats_update()")
+    elif dialect == 'sqlite':
+        op.execute("CREATE TRIGGER IF NOT EXISTS todo_stats_update AFTER UPDATE OF complete, priority ON todos "
+                   f"WHEN old.complete IS NOT new.complete OR old.priority IS NOT new.priority BEGIN {UPSERT}; END")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS todo_stats_update ON todos")
+        op.execute("DROP FUNCTION IF EXISTS todo_stats_update()")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS todo_stats_update")
@@ -0,0 +1,59 @@
+"""create search index on todos
+
+Revision ID: 5d0b7e3c9a61
+Revises: c7f3a9e15b82
+Create Date: 2026-10-18 13:05:27.540918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0b7e3c9a61'
+down_revision: Union[str, Sequence[str], None] = 'c7f3a9e15b82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must stay the same expression as models.TODO_SEARCH_DOCUMENT, otherwise postgres will not use the index for search
+DOCUMENT = ("setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
+SQLITE_TRIGGERS = {
+    'todos_fts_insert': "AFTER INSERT ON todos BEGIN "
+                        "INSERT INTO todos_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    'todos_fts_delete': "AFTER DELETE ON todos BEGIN "
+                        "INSERT INTO todos_fts(todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    'todos_fts_update': "AFTER UPDATE OF title, description ON todos BEGIN "
+                        "INSERT INTO todos_fts(todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+                        "INSERT INTO todos_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        # expression index, no new column so the table is not rewritten, built CONCURRENTLY so writes are not blocked
+        with op.get_context().autocommit_block():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_search ON todos USING gin (({DOCUMENT}))")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(title, description, content='todos', "
+                   "content_rowid='id', tokenize='porter unicode61')")
+        for name, trigger in SQLITE_TRIGGERS.items():
+            op.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}")
+        op.execute("INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')") # index todos which already exist
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_todos_search")
+    elif dialect == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        op.execute("DROP TABLE IF EXISTS todos_fts")
@@ -0,0 +1,47 @@
+"""create owner indexes on todos
+
+Revision ID: 9b1d4c7e2f30
+Revises: 602eb67745cd
+Create Date: 2026-10-18 10:12:41.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1d4c7e2f30'
+down_revision: Union[str, Sequence[str], None] = '602eb67745cd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_todos_owner_id_id': ['owner_id', 'id'],
+    'ix_todos_owner_id_complete_priority': ['owner_id', 'complete', 'priority'],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # On postgres index is built CONCURRENTLY so the todos table is not locked for writes during deploy,
+    # CONCURRENTLY can not run inside a transaction, that's why autocommit_block is used.
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES.items():
+                op.create_index(name, 'todos', columns, if_not_exists=True, postgresql_concurrently=True)
+    else:
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'todos', columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name in INDEXES:
+                op.drop_index(name, table_name='todos', if_exists=True, postgresql_concurrently=True)
+    else:
+        for name in INDEXES:
+            op.drop_index(name, table_name='todos', if_exists=True)
@@ -0,0 +1,38 @@
+"""create todo stats table
+
+Revision ID: a83c5f1d2e64
+Revises: 5d0b7e3c9a61
+Create Date: 2026-10-18 14:21:09.671352
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83c5f1d2e64'
+down_revision: Union[str, Sequence[str], None] = '5d0b7e3c9a61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PRIORITIES = range(1, 6)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    counters = ['total', 'completed'] + [f'priority_{priority}' for priority in PRIORITIES]
+    op.create_table('todo_stats',
+                    sa.Column('owner_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+                    *[sa.Column(counter, sa.Integer(), nullable=False, server_default='0') for counter in counters])
+    # counters of existing todos, same query as stats.rebuild_stats()
+    priority_counts = ', '.join(f'SUM(CASE WHEN priority = {priority} THEN 1 ELSE 0 END)' for priority in PRIORITIES)
+    op.execute(f"INSERT INTO todo_stats (owner_id, {', '.join(counters)}) "
+               f"SELECT owner_id, COUNT(*), SUM(CASE WHEN complete THEN 1 ELSE 0 END), {priority_counts} "
+               f"FROM todos WHERE owner_id IS NOT NULL GROUP BY owner_id")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('todo_stats')
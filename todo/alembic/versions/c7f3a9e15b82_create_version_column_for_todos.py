@@ -0,0 +1,28 @@
+"""create version column for todos
+
+Revision ID: c7f3a9e15b82
+Revises: 4e8a2d6f1c57
+Create Date: 2026-10-18 11:48:05.203317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f3a9e15b82'
+down_revision: Union[str, Sequence[str], None] = '4e8a2d6f1c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todos', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('todos', 'version')
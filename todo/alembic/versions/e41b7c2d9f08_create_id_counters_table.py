@@ -0,0 +1,32 @@
+"""create id counters table
+
+Revision ID: e41b7c2d9f08
+Revises: a83c5f1d2e64
+Create Date: 2026-10-18 16:02:44.183207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41b7c2d9f08'
+down_revision: Union[str, Sequence[str], None] = 'a83c5f1d2e64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('id_counters',
+                    sa.Column('name', sa.String(), primary_key=True),
+                    sa.Column('next_id', sa.Integer(), nullable=False))
+    # counting continues after the todos which already exist, so they can be moved to shards with their ids
+    op.execute("INSERT INTO id_counters (name, next_id) SELECT 'todos', COALESCE(MAX(id), 0) + 1 FROM todos")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('id_counters')
@@ -0,0 +1,61 @@
+'''
+Todo create throughput: N requests to POST /todos/todo vs one POST /todos/batch with N todos.
+
+Runs the real app with TestClient on a temporary sqlite file (auth is overridden, like in tests).
+run from 'todo' folder:  python -m benchmarks.bench_batch --todos 1000
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from database import Base, get_db
+from main import app
+from routers.auth import get_current_user
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--todos", type = int, default = 1000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass = NullPool)
+    sessions = async_sessionmaker(bind = engine, expire_on_commit = False)
+
+    async def create_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    asyncio.run(create_tables())
+
+    async def override_get_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = lambda: {"username": "bench", "id": 1, "user_role": "user"}
+    client = TestClient(app)
+
+    todo = {"title": "Bench Todo", "description": "Benchmark todo", "priority": 3, "complete": False}
+
+    start = time.perf_counter()
+    for _ in range(args.todos):
+        client.post("/todos/todo", json = todo)
+    per_item = args.todos / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for offset in range(0, args.todos, 1000):
+        client.post("/todos/batch", json = [todo] * min(1000, args.todos - offset))
+    batch = args.todos / (time.perf_counter() - start)
+
+    print(f"per item requests: {per_item:10.1f} todos/s")
+    print(f"batch requests:    {batch:10.1f} todos/s  ({batch / per_item:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+'''
+Group commit: todos/s and latency of POST /todos/todo with concurrent clients, for several batch windows
+(0 - group commit off, every todo is its own commit). Check group_commit.py.
+
+Runs the real app in process (httpx ASGI transport, one event loop like one worker) on a temporary sqlite file,
+auth is overridden like in tests. Postgres can be used with --url (tables must exist, rows are left there).
+run from 'todo' folder:  python -m benchmarks.bench_group_commit --clients 50 --todos 2000 --windows 0 1 2 5 10
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base, get_db, get_sessionmaker
+from group_commit import GroupCommitter
+from main import app
+from routers.auth import get_current_user
+import routers.todos
+
+
+async def run(url: str, clients: int, todos: int, window_ms: float, max_items: int):
+    engine = create_async_engine(url, pool_size = clients, max_overflow = 0)
+    sessions = async_sessionmaker(bind = engine, autoflush = False, expire_on_commit = False)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async def override_get_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_sessionmaker] = lambda: sessions
+    app.dependency_overrides[get_current_user] = lambda: {"username": "bench", "id": 1, "user_role": "user"}
+    routers.todos.group_commits = committer = GroupCommitter(window_ms = window_ms, max_items = max_items)
+
+    todo = {"title": "Bench Todo", "description": "Benchmark todo", "priority": 3, "complete": False}
+    latencies = []
+    failed = 0
+    remaining = iter(range(todos))
+
+    async def client(api):
+        nonlocal failed
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await api.post("/todos/todo", json = todo)
+            latencies.append(time.perf_counter() - start)
+            failed += response.status_code != 201 # sqlite answers 'database is locked' when writers wait too long
+
+    transport = httpx.ASGITransport(app = app, raise_app_exceptions = False)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as api:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(api) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    batch = committer.items / committer.batches if committer.batches else 1
+    return (todos - failed) / elapsed, statistics.median(latencies) * 1000, p99 * 1000, batch, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default = None, help = "database url, default is a new temporary sqlite file per window")
+    parser.add_argument("--clients", type = int, default = 50)
+    parser.add_argument("--todos", type = int, default = 2000)
+    parser.add_argument("--windows", type = float, nargs = "+", default = [0, 1, 2, 5, 10], help = "batch windows in ms")
+    parser.add_argument("--max-items", type = int, default = 100)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.todos} todos per window")
+    print(f"{'window ms':>10} {'todos/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'avg batch':>10} {'failed':>7}")
+    for window in args.windows:
+        url = args.url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        rate, p50, p99, batch, failed = asyncio.run(run(url, args.clients, args.todos, window, args.max_items))
+        print(f"{window if window else 'off':>10} {rate:10.1f} {p50:9.2f} {p99:9.2f} {batch:10.1f} {failed:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+'''
+Login throughput vs number of hashing processes.
+
+Every login is one bcrypt verify, so this benchmark sends a burst of concurrent verify calls to HashingExecutor
+and measures verifies(logins) per second for 1, 2, ... cpu_count worker processes.
+
+run from 'todo' folder:  python -m benchmarks.bench_hashing --logins 64
+'''
+import argparse
+import asyncio
+import os
+import time
+
+from hashing import HashingExecutor, bcrypt_context
+
+
+async def run(workers: int, logins: int, hashed_password: str) -> float:
+    executor = HashingExecutor(workers = workers, max_pending = logins)
+    # warm up, so process start up time is not counted
+    await asyncio.gather(*[executor.verify("testpassword", hashed_password) for _ in range(workers)])
+
+    start = time.perf_counter()
+    await asyncio.gather(*[executor.verify("testpassword", hashed_password) for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type = int, default = 64)
+    parser.add_argument("--max-workers", type = int, default = os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    hashed_password = bcrypt_context().hash("testpassword")
+    inline_start = time.perf_counter()
+    bcrypt_context().verify("testpassword", hashed_password)
+    print(f"single verify on event loop: {(time.perf_counter() - inline_start) * 1000:.1f} ms")
+
+    print(f"{'workers':>8} {'logins/s':>10}")
+    for workers in range(1, args.max_workers + 1):
+        throughput = asyncio.run(run(workers, args.logins, hashed_password))
+        print(f"{workers:>8} {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
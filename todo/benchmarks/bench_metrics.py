@@ -0,0 +1,52 @@
+'''
+Overhead of MetricsMiddleware per request.
+
+Two tiny FastAPI apps with the same endpoint, one of them wrapped with MetricsMiddleware, requests are sent straight
+to the ASGI app (no network), so the difference is the cost of the instrumentation.
+run from 'todo' folder:  python -m benchmarks.bench_metrics --requests 20000
+'''
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from metrics import MetricsMiddleware
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/todos/todo/{todo_id}")
+    async def read_todo(todo_id: int):
+        return {"id": todo_id}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app), base_url = "http://bench") as client:
+        for _ in range(200): # warm up
+            await client.get("/todos/todo/1")
+        start = time.perf_counter()
+        for number in range(requests):
+            await client.get(f"/todos/todo/{number}")
+        return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type = int, default = 20000)
+    args = parser.parse_args()
+
+    plain = asyncio.run(run(build_app(False), args.requests))
+    instrumented = asyncio.run(run(build_app(True), args.requests))
+    print(f"without metrics: {plain:8.1f} us/request")
+    print(f"with metrics:    {instrumented:8.1f} us/request  (+{instrumented - plain:.1f} us, {(instrumented / plain - 1) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+'''
+CPU cost of rendering a 10k todo list response.
+
+old: ORM Todos objects -> jsonable_encoder (walks every attribute) -> JSONResponse (python json)
+new: row dicts -> TodoResponse validation/serialization (pydantic-core) -> ORJSONResponse, same path FastAPI takes
+     for endpoints with response_model and the app's default_response_class.
+
+run from 'todo' folder:  python -m benchmarks.bench_serialization --items 10000
+'''
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from models import Todos
+from schemas import TodoResponse
+
+
+def measure(function, repeat: int) -> float:
+    function() # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type = int, default = 10000)
+    parser.add_argument("--repeat", type = int, default = 10)
+    args = parser.parse_args()
+
+    rows = [{"id": number, "title": f"Todo {number}", "description": "Learn To Code Everyday", "priority": number % 5 + 1,
+             "complete": number % 2 == 0, "owner_id": 1, "version": 1} for number in range(1, args.items + 1)]
+    orm_todos = [Todos(**row) for row in rows]
+    adapter = TypeAdapter(list[TodoResponse])
+
+    old = measure(lambda: JSONResponse(jsonable_encoder(orm_todos)), args.repeat)
+    new = measure(lambda: ORJSONResponse(adapter.dump_python(adapter.validate_python(rows), mode = "json")), args.repeat)
+    assert JSONResponse(jsonable_encoder(orm_todos)).body.replace(b" ", b"") == \
+        ORJSONResponse(adapter.dump_python(adapter.validate_python(rows), mode = "json")).body.replace(b" ", b"")
+
+    print(f"ORM + jsonable_encoder + json:       {old:8.2f} ms per response")
+    print(f"rows + TodoResponse + orjson:        {new:8.2f} ms per response  ({old / new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+'''
+Requests per second of 'python -m todo serve' with 1, 2, 4 ... workers.
+
+For every worker count a server is started on a new sqlite file, then a load generator (asyncio + httpx, runs in this
+process) keeps --connections requests in flight for --seconds and counts answered requests.
+Numbers only scale while there are free cores: the load generator needs a core as well, so on a machine with N cores
+expect scaling up to about N - 1 workers.
+run from 'todo' folder:  python -m benchmarks.bench_serving --workers 1 2 4 --seconds 10
+'''
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int):
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+           "DB_SCHEMA_CHECK": "create_all"}
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    server = subprocess.Popen([sys.executable, "-m", "todo", "serve", "--workers", str(workers), "--port", str(port),
+                               "--log-level", "warning"], cwd = root, env = env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/healthy").status_code == 200:
+                return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def load(url: str, connections: int, seconds: float) -> int:
+    done = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections = connections, max_keepalive_connections = connections)
+    async with httpx.AsyncClient(limits = limits) as client:
+        async def user():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                response = await client.get(url)
+                if response.status_code == 200:
+                    done += 1
+        await asyncio.gather(*[user() for _ in range(connections)])
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--connections", type = int, default = 32)
+    parser.add_argument("--seconds", type = float, default = 10)
+    parser.add_argument("--path", default = "/healthy")
+    args = parser.parse_args()
+
+    print(f"cpu cores: {os.cpu_count()}, connections: {args.connections}, path: {args.path}")
+    baseline = None
+    for workers in args.workers:
+        port = free_port()
+        server = start_server(workers, port)
+        try:
+            asyncio.run(load(f"http://127.0.0.1:{port}{args.path}", args.connections, 1)) # warm up every worker
+            rps = asyncio.run(load(f"http://127.0.0.1:{port}{args.path}", args.connections, args.seconds)) / args.seconds
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or rps
+        print(f"workers {workers:3d}: {rps:9.1f} req/s   x{rps / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
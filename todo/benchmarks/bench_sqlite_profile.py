@@ -0,0 +1,94 @@
+'''
+Sqlite profiles: requests/s, latency and failed requests of concurrent readers and writers with DB_SQLITE_PROFILE=default
+and =production (check sqlite_profile.py), each profile on a new temporary sqlite file.
+
+Runs the real app in process (httpx ASGI transport, one event loop like one worker), auth is overridden like in tests and
+every client is a different user. Writers create and update todos, readers call GET /todos/search and GET /todos/stats
+(both always query the database, todo lists would come from todo_cache).
+run from 'todo' folder:  python -m benchmarks.bench_sqlite_profile --readers 20 --writers 10 --seconds 10
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import Request
+
+import database
+import sqlite_profile
+from main import app, prepare_database
+from routers.auth import get_current_user
+
+TODO = {"title": "Bench Todo", "description": "Benchmark todo", "priority": 3, "complete": False}
+
+
+def bench_user(request: Request):
+    return {"username": "bench", "id": int(request.headers["X-Bench-User"]), "user_role": "user"}
+
+
+def percentile(latencies: list, share: float) -> float:
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000 if latencies else 0.0
+
+
+async def run(profile: str, readers: int, writers: int, seconds: float, url: str):
+    sqlite_profile.SQLITE_PROFILE = profile
+    engine = database.init_engine(url)
+    await prepare_database(engine, 'create_all')
+    app.dependency_overrides[get_current_user] = bench_user
+
+    results = {'read': [], 'write': []}
+    failed = {'read': 0, 'write': 0}
+
+    async def call(kind: str, request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await request
+        results[kind].append(time.perf_counter() - start)
+        failed[kind] += response.status_code >= 400 # sqlite answers 'database is locked' when a request waits too long
+        return response
+
+    async def writer(api, user: int, deadline: float):
+        headers = {"X-Bench-User": str(user)}
+        todo_id = (await api.post("/todos/batch", json = [TODO], headers = headers)).json()[0]["id"]
+        while time.perf_counter() < deadline:
+            await call('write', api.post("/todos/todo", json = TODO, headers = headers))
+            await call('write', api.put(f"/todos/todo/{todo_id}", json = {**TODO, "complete": True}, headers = headers))
+
+    async def reader(api, user: int, deadline: float):
+        headers = {"X-Bench-User": str(user)}
+        while time.perf_counter() < deadline:
+            await call('read', api.get("/todos/search", params = {"q": "bench"}, headers = headers))
+            await call('read', api.get("/todos/stats", headers = headers))
+
+    transport = httpx.ASGITransport(app = app, raise_app_exceptions = False)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as api:
+        for user in range(1, readers + 1): # something to read
+            await api.post("/todos/batch", json = [TODO] * 20, headers = {"X-Bench-User": str(user)})
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(writer(api, readers + user, deadline) for user in range(1, writers + 1)),
+                             *(reader(api, user, deadline) for user in range(1, readers + 1)))
+    await database.dispose_engine()
+    return {kind: (len(latencies) / seconds, percentile(latencies, 0.5), percentile(latencies, 0.99), failed[kind])
+            for kind, latencies in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type = int, default = 20)
+    parser.add_argument("--writers", type = int, default = 10)
+    parser.add_argument("--seconds", type = float, default = 10)
+    parser.add_argument("--profiles", nargs = "+", default = list(sqlite_profile.PROFILES), choices = sqlite_profile.PROFILES)
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g} s per profile")
+    print(f"{'profile':>10} {'':>6} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for profile in args.profiles:
+        url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+        for kind, (rate, p50, p99, failed) in asyncio.run(run(profile, args.readers, args.writers, args.seconds, url)).items():
+            print(f"{profile:>10} {kind:>6} {rate:8.1f} {p50:9.2f} {p99:9.2f} {failed:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+'''
+Cold start: time from starting a new server process to its first 200 response, the number autoscaling waits for.
+
+Every run starts 'uvicorn main:app' in a new process on a new sqlite file and polls GET /healthy until it answers 200.
+'import' is measured separately in a new python process (time of 'import main' only).
+run from 'todo' folder:  python -m benchmarks.bench_startup --runs 5
+'''
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time() -> float:
+    output = subprocess.run([sys.executable, "-c", "import time; start = time.perf_counter(); import main; "
+                             "print(time.perf_counter() - start)"], capture_output = True, text = True, check = True)
+    return float(output.stdout)
+
+
+def first_response_time(env: dict, timeout: float = 30) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              env = env)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthy", timeout = 1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError("server did not answer in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type = int, default = 5)
+    args = parser.parse_args()
+
+    imports, starts = [], []
+    for _ in range(args.runs):
+        env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+               "DB_SCHEMA_CHECK": "create_all"}
+        imports.append(import_time())
+        starts.append(first_response_time(env))
+
+    print(f"runs: {args.runs}")
+    print(f"import main:                  median {statistics.median(imports) * 1000:7.1f} ms   min {min(imports) * 1000:7.1f} ms")
+    print(f"process start to first 200:   median {statistics.median(starts) * 1000:7.1f} ms   min {min(starts) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
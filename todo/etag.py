@@ -0,0 +1,65 @@
+import hashlib
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import select, update
+from starlette import status
+from models import Users
+
+'''
+ETag / conditional GET support.
+Every user has a 'version' number (users.version). Every endpoint which changes user's todos or user's profile
+increases it in the same transaction. ETag of a read endpoint is built from that version, so when client sends
+'If-None-Match' with the ETag it already has and version did not change, we answer 304 Not Modified after one tiny
+primary key lookup, without loading or serializing any todo.
+A single todo has its own ETag, its todos.version ("3"), so the ETag client got from GET /todos/todo/{id} can be sent
+back as it is in 'If-Match' of PUT/DELETE.
+'''
+
+
+async def bump_version(db, owner_id):
+    '''
+    Must be called before db.commit() of every write to the user's todos or profile.
+    '''
+    await db.execute(update(Users).where(Users.id == owner_id).values(version = Users.version + 1))
+
+
+async def owner_version(db, owner_id):
+    return (await db.execute(select(Users.version).where(Users.id == owner_id))).scalar()
+
+
+def todo_etag(version) -> str:
+    return f'"{version}"'
+
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32] + '"'
+
+
+def expected_version(request: Request):
+    '''
+    Optimistic concurrency: client sends version of the todo it has read in 'If-Match' header (for example If-Match: "3"),
+    write is done only if todo still has that version. Returns None when header is missing or '*'.
+    A well formed ETag which is not a todo version (for example an old list ETag) can never match, it gives 0
+    (versions start from 1), so the write answers 412 like for any other outdated ETag.
+    '''
+    if_match = request.headers.get('if-match')
+    if if_match is None or if_match.strip() == '*':
+        return None
+    tag = if_match.strip().removeprefix('W/')
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        if len(tag) > 2 and tag.startswith('"') and tag.endswith('"'):
+            return 0
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = 'Invalid If-Match Header')
+
+
+def not_modified(request: Request, etag: str):
+    '''
+    Returns 304 response if client already has this version, else None.
+    '''
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return None
+    if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code = status.HTTP_304_NOT_MODIFIED, headers = {'ETag': etag})
+    return None
@@ -0,0 +1,115 @@
+import asyncio
+import os
+from collections import defaultdict
+from sqlalchemy import insert
+from models import Todos
+from etag import bump_version
+from shard_map import shards
+from sharding import assign_todo_ids
+from stats import change_stats, todo_delta
+
+'''
+Group commit for POST /todos/todo, switched on with GROUP_COMMIT_WINDOW_MS environment variable (0 - off, default).
+Normally every created todo is its own transaction and every commit waits for the database to flush its log to disk,
+so during bursts of creates the commit latency (not CPU) limits todos per second.
+With group commit a create waits up to GROUP_COMMIT_WINDOW_MS for other creates (of any user) and all of them are written
+together: one multi row INSERT, one stats / version update per owner, and one commit. A batch is written earlier when it
+reaches GROUP_COMMIT_MAX_ITEMS. Every request gets its response only after the commit of its batch, so a 201 still means
+the todo is stored. If the batch fails, every request in it gets the error and nothing of the batch is stored.
+With sharding (check shard_map.py) owners of different shards are never in the same batch, every shard gets batches
+of its own, so a batch is one transaction on one shard and a failing shard does not fail (or half store) the others.
+Batches are also kept apart per session factory, every batch is written with the factory its requests gave.
+Single creates get up to one window of extra latency, so the window should stay a few milliseconds
+(check benchmarks/bench_group_commit.py).
+'''
+
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('GROUP_COMMIT_WINDOW_MS', '0'))
+GROUP_COMMIT_MAX_ITEMS = int(os.getenv('GROUP_COMMIT_MAX_ITEMS', '100'))
+
+
+class GroupCommitter:
+
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_items: int = GROUP_COMMIT_MAX_ITEMS):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self.pending = {}    # (session_factory, shard) -> [(owner_id, todo_request, future)] waiting for the next batch
+        self.timer = None
+        self.writing = set() # running write tasks, kept here so they are not garbage collected before they finish
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def submit(self, session_factory, owner_id, todo_request) -> int:
+        '''
+        Adds one todo to the next batch and waits until that batch is committed, returns id of the new todo.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        key = (session_factory, shards.shard_for(owner_id))
+        batch = self.pending.setdefault(key, [])
+        batch.append((owner_id, todo_request, future))
+        if len(batch) >= self.max_items:
+            self.start(session_factory, self.pending.pop(key))
+            if not self.pending and self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        # shield - request which is cancelled (client went away) does not cancel the write of the others
+        return await asyncio.shield(future)
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batches, self.pending = self.pending, {}
+        for (session_factory, _), batch in batches.items():
+            self.start(session_factory, batch)
+
+    def start(self, session_factory, batch: list):
+        task = asyncio.get_running_loop().create_task(self.write(session_factory, batch))
+        self.writing.add(task)
+        task.add_done_callback(self.writing.discard)
+
+    async def drain(self):
+        '''
+        Writes the waiting todos now and waits for all running batches, called when app stops.
+        '''
+        self.flush()
+        if self.writing:
+            await asyncio.gather(*self.writing, return_exceptions = True)
+
+    async def write(self, session_factory, batch: list):
+        try:
+            async with session_factory() as db:
+                ids = await self.insert(db, batch)
+            self.batches += 1
+            self.items += len(batch)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future), todo_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(todo_id)
+
+    async def insert(self, db, batch: list) -> list:
+        rows = [{**todo_request.model_dump(), 'owner_id': owner_id} for owner_id, todo_request, _ in batch]
+        await assign_todo_ids(rows)
+        shards.route(db, rows[0]['owner_id']) # all owners of a batch are on the same shard
+        # one multi row INSERT ... RETURNING id, like POST /todos/batch
+        ids = (await db.execute(insert(Todos).returning(Todos.id, sort_by_parameter_order = True), rows)).scalars().all()
+        owners = defaultdict(list)
+        for owner_id, todo_request, _ in batch:
+            owners[owner_id].append(todo_request)
+        for owner_id, todo_requests in owners.items():
+            await change_stats(db, owner_id, todo_delta(todo_requests))
+            await bump_version(db, owner_id)
+        await db.commit()
+        return ids
+
+
+group_commits = GroupCommitter()
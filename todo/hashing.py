@@ -0,0 +1,86 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from starlette import status
+from functools import lru_cache
+
+'''
+bcrypt hash/verify takes around 200-300 ms of pure CPU. If we run it directly inside async endpoint it blocks the event loop
+and every other request on that worker waits. So hashing work is sent to a pool of processes (process and not thread,
+because bcrypt holds the GIL for python code around it and processes can use all the cores).
+'''
+
+@lru_cache(maxsize = None)
+def bcrypt_context():
+    # passlib and bcrypt backend are loaded on first hash/verify (in the worker process), not when app is imported
+    from passlib.context import CryptContext # needed for hashing password
+    return CryptContext(schemes = ['bcrypt'], deprecated = 'auto')
+
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(os.cpu_count() or 1)))
+# how many hash/verify calls can wait for a free process, after that we answer 503 straight away instead of
+# letting requests pile up and time out.
+HASH_QUEUE_DEPTH = int(os.getenv('HASH_QUEUE_DEPTH', str(HASH_WORKERS * 8)))
+
+
+# below two functions run inside worker processes, they must be module level functions so they can be pickled.
+def _hash(password: str) -> str:
+    return bcrypt_context().hash(password)
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt_context().verify(password, hashed_password)
+
+
+class HashingExecutor:
+    '''
+    Process pool for bcrypt work with bounded number of pending calls (load shedding).
+    Pool is created on first use, so importing this module does not start any process.
+    '''
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_QUEUE_DEPTH):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers = self.workers)
+        return self._executor
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail = 'Server Busy, Try Again',
+                                headers = {'Retry-After': '1'})
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait = True)
+            self._executor = None
+
+
+hashing_executor = HashingExecutor()
+
+# process pool of the parent can not be used from a forked child, child creates its own on first use
+os.register_at_fork(after_in_child = lambda: setattr(hashing_executor, '_executor', None))
+
+async def hash_password(password: str) -> str:
+    return await hashing_executor.hash(password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await hashing_executor.verify(password, hashed_password)
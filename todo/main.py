@@ -1,41 +1,122 @@
-from fastapi import FastAPI, Request, status
+from contextlib import asynccontextmanager
+from typing import Annotated
+from fastapi import APIRouter, Depends, FastAPI, Request, status
 # from todo.models import Base
-from database import engine, SessionLocal, Base
+from database import Base, get_db, pool_stats, init_engine, dispose_engine, check_schema_revision, SCHEMA_CHECK
+from hashing import hashing_executor
+from todo_events import todo_events
+from group_commit import group_commits
+from metrics import MetricsMiddleware, instrument_engine, render
+import query_diagnostics
+from profiling import ProfilingMiddleware
+from replicas import ReadYourWritesMiddleware, replicas
+from shard_map import shards
 from routers import auth, todos, admin, user
 # commenting out below import of jinja2, because we will use redirectresponse so jinja2 is not required, we will change below
 #'templates' variable and function endpoint also
 # from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-
-# this below line will not automatically be ran if we change anything in our model.py, since we have defined table in model.py,
-# so we need to delete the database file 'todos.db' in this folder and then run this below line to create new db file everytime model.py changes.
-# further we will see how to enhance db without deleting the db file everytime using Alembic in coming lectures.
-Base.metadata.create_all(bind = engine)
-
+from fastapi.responses import RedirectResponse, ORJSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 '''
-For frontend we need two installations 1. aiofiles 2. jinja2
+App factory: create_app() builds the FastAPI app, nothing touches database at import time.
+Engine is created in lifespan when server starts, and instead of running create_all on every start (which connects and
+reflects the whole schema) we only check that database is at the newest alembic revision, check database.py.
+Jinja templates and passlib are loaded on first use as well (check pages.py and hashing.py), so importing main is cheap,
+every new worker (and autoscaled instance) starts answering sooner, check benchmarks/bench_startup.py.
+'uvicorn main:app' uses the 'app' created at the bottom of this file.
 '''
-# not using jinja2 so commenting out, using redirectresponse instead.
-# templates = Jinja2Templates(directory = "todo/templates") #this todo/templates is the directory where our todoapp html files is going to live
-
-app = FastAPI()
-
-app.mount("/static", StaticFiles(directory="static"), name = "static")
 
+router = APIRouter()
 
 # Below endpoint is created which will allow to open up this html file
-@app.get("/")
+@router.get("/")
 def test(request : Request):
     # return templates.TemplateResponse("home.html", {"request": request})
     return RedirectResponse(url="/todos/todo-page", status_code=status.HTTP_302_FOUND)
 
-@app.get("/healthy")
-def health_check():
+# readiness check, answers 'Healthy' only when a connection from pool can run a query
+@router.get("/healthy")
+async def health_check(db: Annotated[AsyncSession, Depends(get_db)]):
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception:
+        return ORJSONResponse({"status": "Unavailable"}, status_code = status.HTTP_503_SERVICE_UNAVAILABLE)
     return {"status": "Healthy"}
 
-app.include_router(auth.router)
-app.include_router(todos.router)
-app.include_router(admin.router)
-app.include_router(user.router)
+@router.get("/metrics", response_class = PlainTextResponse)
+def read_metrics():
+    return PlainTextResponse(render(pool_stats()), media_type = "text/plain; version=0.0.4")
+
+
+async def prepare_database(engine, schema_check: str):
+    if schema_check == 'create_all':
+        # 'run_sync' runs the normal (sync) create_all function on top of async connection.
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        if shards.enabled:
+            from sharding import create_shard_schemas # same as 'python -m sharding init'
+            await create_shard_schemas(engine)
+    elif schema_check == 'revision':
+        await check_schema_revision(engine)
+
+
+def create_app(database_url: str = None, schema_check: str = SCHEMA_CHECK, replica_urls: list = None,
+               shard_map: str = None) -> FastAPI:
+    '''
+    database_url - default is DATABASE_URL environment variable, schema_check - 'revision', 'create_all' or 'off',
+    replica_urls - read replicas, default is DATABASE_REPLICA_URLS environment variable (check replicas.py),
+    shard_map - file of todo shards, default is SHARD_MAP environment variable (check shard_map.py).
+    '''
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        engine = init_engine(database_url, replica_urls, shard_map)
+        # per route SQL statements in /metrics, and slow query / N+1 logging when SQL_DIAGNOSTICS=1
+        for instrumented in [engine] + replicas.engines + shards.owned:
+            instrument_engine(instrumented)
+            if query_diagnostics.SQL_DIAGNOSTICS:
+                query_diagnostics.install(instrumented)
+        try:
+            await prepare_database(engine, schema_check)
+        except Exception:
+            await dispose_engine()
+            raise
+        replicas.start() # schema of replicas comes from primary by replication, they are only health checked
+        yield
+        await group_commits.drain()
+        await todo_events.stop()
+        await dispose_engine()
+        hashing_executor.shutdown()
+
+    '''
+    For frontend we need two installations 1. aiofiles 2. jinja2
+    '''
+    app = FastAPI(lifespan = lifespan, default_response_class = ORJSONResponse) # orjson renders json much faster than python json module
+
+    app.mount("/static", StaticFiles(directory="static"), name = "static")
+
+    # per route latency, status codes and SQL statements per request, served at /metrics, check metrics.py
+    app.add_middleware(MetricsMiddleware)
+
+    # slow query and query budget (N+1) logging, only when SQL_DIAGNOSTICS=1, check query_diagnostics.py
+    if query_diagnostics.SQL_DIAGNOSTICS:
+        app.add_middleware(query_diagnostics.QueryDiagnosticsMiddleware)
+
+    # admins can profile one request with 'X-Profile: 1' header, check profiling.py
+    app.add_middleware(ProfilingMiddleware, get_user = auth.get_current_user)
+
+    # reads of a user who just wrote something stay on primary for a few seconds, only with read replicas, check replicas.py
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    app.include_router(router)
+    app.include_router(auth.router)
+    app.include_router(todos.router)
+    app.include_router(admin.router)
+    app.include_router(user.router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,172 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+
+'''
+Request and database metrics in Prometheus text format, served at GET /metrics.
+
+MetricsMiddleware measures every request (latency, in flight requests, status codes) and SQLAlchemy engine events
+count SQL statements and their time for the request which is running (request is found through a ContextVar,
+SQLAlchemy async runs engine events in the same context as the request task).
+Only plain counters are used, no locks, everything runs on the event loop thread of the worker.
+'''
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help, self.kind = name, help, 'counter'
+        self.values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.kind = 'gauge'
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.kind = name, help, 'histogram'
+        self.buckets = buckets
+        self.values = {} # labels -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, labels: tuple, value: float):
+        data = self.values.get(labels)
+        if data is None:
+            data = self.values[labels] = [0] * (len(self.buckets) + 2)
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def samples(self):
+        for labels, data in self.values.items():
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), data):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + (('le', str(bucket)),), cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, data[-1]
+
+
+requests_total = Counter('http_requests_total', 'HTTP requests by method, route and status code.')
+request_duration = Histogram('http_request_duration_seconds', 'HTTP request latency by method and route.')
+requests_in_flight = Gauge('http_requests_in_flight', 'HTTP requests currently being served.')
+db_statements = Histogram('db_statements_per_request', 'SQL statements executed per request by route.', STATEMENT_BUCKETS)
+db_time = Histogram('db_time_per_request_seconds', 'Time spent in SQL statements per request by route.')
+db_statements_total = Counter('db_statements_total', 'SQL statements executed.')
+db_statement_duration = Histogram('db_statement_duration_seconds', 'SQL statement latency.')
+pool_gauge = Gauge('db_pool', 'Connection pool statistics.')
+
+REGISTRY = [requests_total, request_duration, requests_in_flight, db_statements, db_time,
+            db_statements_total, db_statement_duration, pool_gauge]
+
+
+class RequestStats:
+    __slots__ = ('statements', 'db_time')
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+current_request = ContextVar('current_request', default = None)
+
+
+def route_label(scope) -> str:
+    # route template (like /todos/todo/{todo_id}) and not the real path, so number of label values stays small
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+class MetricsMiddleware:
+    '''
+    Plain ASGI middleware (not BaseHTTPMiddleware) to keep the cost per request small.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+        requests_in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.inc(amount = -1)
+            current_request.reset(token)
+            labels = (('method', scope['method']), ('route', route_label(scope)))
+            requests_total.inc(labels + (('status', str(status_code)),))
+            request_duration.observe(labels, elapsed)
+            db_statements.observe(labels, stats.statements)
+            db_time.observe(labels, stats.db_time)
+
+
+def instrument_engine(engine):
+    '''
+    Adds statement counting to an engine (sync or async), can be called for more than one engine.
+    '''
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        db_statements_total.inc()
+        db_statement_duration.observe((), elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render(pool_stats: dict = None) -> str:
+    if pool_stats:
+        for key, value in pool_stats.items():
+            pool_gauge.set((('stat', key),), value)
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, Index, DDL, event
 
 # Creat Users table 
 class Users(Base):
@@ -14,6 +14,7 @@ class Users(Base):
     is_active = Column(Boolean, default=True)
     role = Column(String)
     phone_number = Column(String)
+    version = Column(Integer, nullable=False, default=1, server_default='1') # increased on every change of user's todos or profile, used for ETag
 
 # Create todos table
 class Todos(Base):
@@ -25,3 +26,102 @@ class Todos(Base):
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, nullable=False, default=1, server_default='1') # increased on every update, used with 'If-Match' header
+
+    # every todo endpoint filters on owner_id, these indexes let database jump directly to one user's todos
+    # instead of scanning whole table. Same indexes are created on existing databases by alembic revision 9b1d4c7e2f30.
+    __table_args__ = (
+        Index('ix_todos_owner_id_id', 'owner_id', 'id'),                               # list of user's todos, todo by id, keyset pages
+        Index('ix_todos_owner_id_complete_priority', 'owner_id', 'complete', 'priority'), # filters on complete and priority
+    )
+
+
+# Counters of each user's todos, changed in the same transaction as todos (check stats.py), so stats are read with one
+# primary key lookup instead of counting todos. 'python -m stats rebuild' recounts them.
+# Creates and deletes change them from the endpoints, updates of complete/priority by a trigger (TODO_STATS_DDL below).
+class TodoStats(Base):
+    __tablename__ = 'todo_stats'
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0, server_default='0')
+    completed = Column(Integer, nullable=False, default=0, server_default='0')
+    priority_1 = Column(Integer, nullable=False, default=0, server_default='0')
+    priority_2 = Column(Integer, nullable=False, default=0, server_default='0')
+    priority_3 = Column(Integer, nullable=False, default=0, server_default='0')
+    priority_4 = Column(Integer, nullable=False, default=0, server_default='0')
+    priority_5 = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+# Next free id of sharded tables, kept in the main database. With sharding (check sharding.py) every shard has its own
+# todos table, so ids are handed out from here instead of each shard's own sequence, todo ids stay unique over all shards
+# and todos can be moved to another shard with the same id.
+class IdCounters(Base):
+    __tablename__ = 'id_counters'
+
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+# Full text search index over title and description, used by GET /todos/search (check search.py).
+# It is not a column of the model, database keeps it in sync by itself on every insert/update/delete (also batch ones):
+#   postgres - GIN index on tsvector expression, postgres updates index with the row
+#   sqlite   - FTS5 table with external content (text is not stored twice), filled by triggers on todos
+# create_all creates it together with todos table, existing databases get it from alembic revision 5d0b7e3c9a61.
+TODO_SEARCH_DOCUMENT = ("setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                        "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
+TODO_SEARCH_DDL = {
+    'postgresql': [
+        f"CREATE INDEX IF NOT EXISTS ix_todos_search ON todos USING gin (({TODO_SEARCH_DOCUMENT}))",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(title, description, content='todos', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN "
+        "INSERT INTO todos_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN "
+        "INSERT INTO todos_fts(todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF title, description ON todos BEGIN "
+        "INSERT INTO todos_fts(todos_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO todos_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    ],
+}
+
+for dialect, statements in TODO_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(Todos.__table__, 'after_create', DDL(statement).execute_if(dialect = dialect))
+
+
+# Updates of complete/priority correct the counters in the database itself, old values are visible only there, so
+# update endpoints need no SELECT of old values before their UPDATE ... RETURNING. Same upsert as stats.change_stats().
+# create_all creates it after all tables, existing databases get it from alembic revision 3c8e5a1f7b94.
+TODO_STATS_PRIORITIES = range(1, 6)
+
+def _flag_change(condition: str) -> str:
+    return f"(CASE WHEN new.{condition} THEN 1 ELSE 0 END) - (CASE WHEN old.{condition} THEN 1 ELSE 0 END)"
+
+TODO_STATS_CHANGES = {'completed': _flag_change('complete'),
+                      **{f'priority_{priority}': _flag_change(f'priority = {priority}') for priority in TODO_STATS_PRIORITIES}}
+
+TODO_STATS_UPSERT = (f"INSERT INTO todo_stats (owner_id, {', '.join(TODO_STATS_CHANGES)}) "
+                     f"VALUES (new.owner_id, {', '.join(TODO_STATS_CHANGES.values())}) ON CONFLICT (owner_id) DO UPDATE SET "
+                     + ', '.join(f'{counter} = todo_stats.{counter} + excluded.{counter}' for counter in TODO_STATS_CHANGES))
+
+TODO_STATS_DDL = {
+    'postgresql': [
+        f"CREATE OR REPLACE FUNCTION todo_stats_update() RETURNS trigger LANGUAGE plpgsql AS $$ "
+        f"BEGIN {TODO_STATS_UPSERT}; RETURN NULL; END $$",
+        "DROP TRIGGER IF EXISTS todo_stats_update ON todos",
+        "CREATE TRIGGER todo_stats_update AFTER UPDATE OF complete, priority ON todos FOR EACH ROW "
+        "WHEN (old.complete IS DISTINCT FROM new.complete OR old.priority IS DISTINCT FROM new.priority) "
+        "EXECUTE FUNCTION todo_stats_update()",
+    ],
+    'sqlite': [
+        "CREATE TRIGGER IF NOT EXISTS todo_stats_update AFTER UPDATE OF complete, priority ON todos "
+        f"WHEN old.complete IS NOT new.complete OR old.priority IS NOT new.priority BEGIN {TODO_STATS_UPSERT}; END",
+    ],
+}
+
+for dialect, statements in TODO_STATS_DDL.items():
+    for statement in statements:
+        event.listen(Base.metadata, 'after_create', DDL(statement).execute_if(dialect = dialect)) # needs todos and todo_stats
@@ -0,0 +1,11 @@
+from functools import lru_cache
+
+'''
+Jinja2 templates of the html pages. Jinja2 is imported and templates object is created on first page render and not at
+import time, API only workers and tests never pay for it.
+'''
+
+@lru_cache(maxsize = None)
+def templates():
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory = "templates")
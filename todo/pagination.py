@@ -0,0 +1,113 @@
+import base64
+import json
+from typing import Literal, Optional
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import tuple_
+from models import Todos
+
+'''
+Keyset (cursor) pagination for todo lists.
+Instead of OFFSET (which makes database read and throw away all the skipped rows) we remember the last row of the page
+in the cursor and ask database only for rows after it: WHERE (priority, id) > (last_priority, last_id) LIMIT n.
+With index this costs the same for first page and for the 1000th page.
+Cursor is sent to client base64 encoded, client should not build it by itself, just send back what it received.
+'''
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+SortOption = Literal['id', '-id', 'priority', '-priority']
+
+
+def encode_cursor(todo, sort: str) -> str:
+    key = {'s': sort, 'id': todo.id}
+    if sort.lstrip('-') == 'priority':
+        key['p'] = todo.priority
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> dict:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if key['s'] != sort or not isinstance(key['id'], int):
+            raise ValueError
+        if sort.lstrip('-') == 'priority' and not isinstance(key['p'], int):
+            raise ValueError
+        return key
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code = 400, detail = 'Invalid Cursor')
+
+
+class TodoPage:
+    '''
+    Query parameters shared by the todo list endpoints, used as dependency: page : Annotated[TodoPage, Depends()]
+    '''
+
+    def __init__(self,
+                 limit : int = Query(DEFAULT_PAGE_SIZE, ge = 1, le = MAX_PAGE_SIZE),
+                 cursor : Optional[str] = Query(None),
+                 complete : Optional[bool] = Query(None),
+                 priority_min : Optional[int] = Query(None, ge = 1, le = 5),
+                 priority_max : Optional[int] = Query(None, ge = 1, le = 5),
+                 sort : SortOption = Query('id')):
+        self.limit = limit
+        self.cursor = cursor
+        self.complete = complete
+        self.priority_min = priority_min
+        self.priority_max = priority_max
+        self.sort = sort
+
+    def key_fields(self) -> tuple:
+        '''
+        Columns which are needed to build the cursor, they are always selected even if client did not ask for them.
+        '''
+        return ('priority', 'id') if self.sort.lstrip('-') == 'priority' else ('id',)
+
+    def cache_key(self) -> str:
+        return (f'limit={self.limit}&cursor={self.cursor}&complete={self.complete}'
+                f'&priority_min={self.priority_min}&priority_max={self.priority_max}&sort={self.sort}')
+
+    def apply(self, query):
+        '''
+        Adds filters, keyset condition, order by and limit to a select(Todos) query.
+        One extra row is fetched to know if there is a next page.
+        '''
+        if self.complete is not None:
+            query = query.where(Todos.complete == self.complete)
+        if self.priority_min is not None:
+            query = query.where(Todos.priority >= self.priority_min)
+        if self.priority_max is not None:
+            query = query.where(Todos.priority <= self.priority_max)
+
+        descending = self.sort.startswith('-')
+        by_priority = self.sort.lstrip('-') == 'priority'
+        columns = [Todos.priority, Todos.id] if by_priority else [Todos.id]
+
+        if self.cursor is not None:
+            key = decode_cursor(self.cursor, self.sort)
+            if by_priority:
+                position, last = tuple_(Todos.priority, Todos.id), tuple_(key['p'], key['id'])
+            else:
+                position, last = Todos.id, key['id']
+            query = query.where(position < last if descending else position > last)
+
+        return query.order_by(*[column.desc() if descending else column.asc() for column in columns]).limit(self.limit + 1)
+
+    def merge(self, rows) -> list:
+        '''
+        Rows of several shards (each already ordered and limited by apply()) in page order, with the one extra row.
+        '''
+        descending = self.sort.startswith('-')
+        by_priority = self.sort.lstrip('-') == 'priority'
+        rows = sorted(rows, key = (lambda row: (row.priority, row.id)) if by_priority else (lambda row: row.id), reverse = descending)
+        return rows[:self.limit + 1]
+
+    def page(self, rows, response: Response):
+        '''
+        Cuts the extra row and puts cursor for next page in 'X-Next-Cursor' header, response body stays a plain list.
+        '''
+        rows = list(rows)
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers['X-Next-Cursor'] = encode_cursor(rows[-1], self.sort)
+        return rows
@@ -0,0 +1,192 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+
+'''
+Profiling of single requests, for admins only.
+Admin adds 'X-Profile: 1' header (or '?profile=1' query parameter) to a request, that request is run under cProfile
+(auth decode, database calls, jinja rendering, everything which runs on the event loop thread) and the profile is stored
+in memory. Response gets 'X-Profile-Id' header, profile is downloaded from GET /admin/profiles/{id}
+(as text report, or '?format=pstats' file for snakeviz / pstats module).
+
+Requests without the flag only pay for one header lookup. Profiler is started before the admin check, so the profile
+has the token decode as well (the check puts the user in token_cache, the endpoint's get_current_user only finds it there),
+for flagged requests of other users profile is thrown away. Settings (environment variables):
+    PROFILE_SAMPLE_RATE   - part of flagged requests which are really profiled, 0.1 means every 10th on average
+    PROFILE_MIN_INTERVAL  - overhead cap, at most one profile per this many seconds per worker
+    PROFILE_MAX_SECONDS   - overhead cap, profiler is switched off after this many seconds even if request still runs
+    PROFILE_KEEP          - how many last profiles are kept for download
+Only one request is profiled at a time, cProfile measures the whole event loop thread, so other requests running at
+the same time show up in the profile as well. Work done in other threads or processes (sync endpoints in threadpool,
+password hashing pool) is not in the profile.
+'''
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_MIN_INTERVAL = float(os.getenv('PROFILE_MIN_INTERVAL', '1.0'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '30'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+PROFILE_TOP = 60 # number of functions in text report
+
+
+class RequestProfile:
+
+    def __init__(self, profile_id: str, route: str, duration: float, stats: pstats.Stats, truncated: bool):
+        self.id = profile_id
+        self.route = route
+        self.duration = duration
+        self.created = time.time()
+        self.truncated = truncated
+        self.stats = stats
+
+    def summary(self) -> dict:
+        return {'id': self.id, 'route': self.route, 'duration_ms': round(self.duration * 1000, 3),
+                'created': self.created, 'truncated': self.truncated}
+
+    def text(self, sort: str = 'cumulative') -> str:
+        buffer = io.StringIO()
+        self.stats.stream = buffer
+        self.stats.sort_stats(sort).print_stats(PROFILE_TOP)
+        return buffer.getvalue()
+
+    def dump(self) -> bytes:
+        # same format as pstats.Stats.dump_stats() writes to a file
+        return marshal.dumps(self.stats.stats)
+
+
+class ProfileStore:
+    '''
+    Last PROFILE_KEEP profiles, oldest is dropped first.
+    '''
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._profiles = OrderedDict()
+
+    def add(self, profile: RequestProfile):
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last = False)
+
+    def get(self, profile_id: str):
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+    def clear(self):
+        self._profiles.clear()
+
+
+profile_store = ProfileStore()
+
+
+def requested(scope) -> bool:
+    for name, value in scope['headers']:
+        if name == b'x-profile':
+            return value.strip().lower() in (b'1', b'true', b'yes')
+    if b'profile=' in scope.get('query_string', b''):
+        values = parse_qs(scope['query_string'].decode('latin-1')).get('profile', [])
+        return bool(values) and values[-1].lower() in ('1', 'true', 'yes')
+    return False
+
+
+def request_token(scope):
+    # same places as the rest of the app reads the token from: bearer header for API, 'access_token' cookie for pages
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                return token
+        elif name == b'cookie':
+            for cookie in value.decode('latin-1').split(';'):
+                key, _, token = cookie.strip().partition('=')
+                if key == 'access_token' and token:
+                    return token
+    return None
+
+
+class ProfilingMiddleware:
+    '''
+    Plain ASGI middleware, check the top of this file.
+    '''
+
+    def __init__(self, app, get_user, store: ProfileStore = profile_store, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 min_interval: float = PROFILE_MIN_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.app = app
+        self.get_user = get_user # routers.auth.get_current_user, passed in so this module does not import routers
+        self.store = store
+        self.sample_rate = sample_rate
+        self.min_interval = min_interval
+        self.max_seconds = max_seconds
+        self.running = False
+        self.last_start = float('-inf')
+
+    async def is_admin(self, scope) -> bool:
+        token = request_token(scope)
+        if token is None:
+            return False
+        try:
+            user = await self.get_user(token)
+        except HTTPException:
+            return False
+        return user is not None and user.get('user_role') == 'admin'
+
+    def may_start(self) -> bool:
+        if self.running or time.monotonic() - self.last_start < self.min_interval:
+            return False
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not requested(scope) or not self.may_start():
+            await self.app(scope, receive, send)
+            return
+
+        self.running = True
+        previous_start, self.last_start = self.last_start, time.monotonic()
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        truncated = False
+        admin = False
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            admin = await self.is_admin(scope)
+        finally:
+            if not admin:
+                # profile of other user is thrown away and does not count for min_interval
+                profiler.disable()
+                self.running, self.last_start = False, previous_start
+        if not admin:
+            await self.app(scope, receive, send)
+            return
+
+        def stop():
+            nonlocal truncated
+            truncated = True
+            profiler.disable()
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        timer = asyncio.get_running_loop().call_later(self.max_seconds, stop)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            timer.cancel()
+            self.running = False
+            route = scope.get('route')
+            self.store.add(RequestProfile(profile_id, f"{scope['method']} {getattr(route, 'path', None) or scope['path']}",
+                                          duration, pstats.Stats(profiler), truncated))
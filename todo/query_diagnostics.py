@@ -0,0 +1,113 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+
+'''
+Opt-in SQL diagnostics, switched on with SQL_DIAGNOSTICS=1 environment variable.
+- every statement slower than SLOW_QUERY_MS is logged together with the route which ran it
+- request which runs more than QUERY_BUDGET statements is logged, with the statements repeated in that request
+  (same statement again and again in one request is usually N+1 problem)
+For tests there is QueryCounter, which counts statements of an engine inside a 'with' block, check test/utils.py.
+'''
+
+SQL_DIAGNOSTICS = os.getenv('SQL_DIAGNOSTICS', '0').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '10'))
+
+logger = logging.getLogger('todo.sql')
+
+
+class RequestQueries:
+    __slots__ = ('scope', 'statements', 'slow_query_ms')
+
+    def __init__(self, scope, slow_query_ms: float):
+        self.scope = scope
+        self.statements = []
+        self.slow_query_ms = slow_query_ms
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get('route')
+        return f"{self.scope['method']} {getattr(route, 'path', None) or self.scope['path']}"
+
+
+current_queries = ContextVar('current_queries', default = None)
+
+
+class QueryDiagnosticsMiddleware:
+
+    def __init__(self, app, slow_query_ms: float = SLOW_QUERY_MS, query_budget: int = QUERY_BUDGET):
+        self.app = app
+        self.slow_query_ms = slow_query_ms
+        self.query_budget = query_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope, self.slow_query_ms)
+        token = current_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_queries.reset(token)
+            if len(queries.statements) > self.query_budget:
+                repeated = [f'{count}x {statement}' for statement, count in Counter(queries.statements).most_common() if count > 1]
+                logger.warning('query budget exceeded: %s ran %d statements (budget %d), repeated: %s',
+                               queries.route, len(queries.statements), self.query_budget, repeated or 'none')
+
+
+def install(engine):
+    '''
+    Adds diagnostics listeners to an engine (sync or async). Statements outside of a request are ignored.
+    '''
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        context._diagnostics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        queries = current_queries.get()
+        if queries is None:
+            return
+        queries.statements.append(statement)
+        elapsed_ms = (time.perf_counter() - context._diagnostics_start) * 1000
+        if elapsed_ms >= queries.slow_query_ms:
+            logger.warning('slow query: %.1f ms in %s: %s', elapsed_ms, queries.route, statement)
+
+
+class QueryCounter:
+    '''
+    Counts statements executed by an engine while the 'with' block runs, from any thread or task.
+    '''
+
+    def __init__(self, engine):
+        self.engine = getattr(engine, 'sync_engine', engine)
+        self.statements = []
+
+    def _record(self, connection, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'after_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'after_cursor_execute', self._record)
+
+
+@contextmanager
+def assert_num_queries(engine, expected: int):
+    with QueryCounter(engine) as counter:
+        yield counter
+    assert counter.count == expected, f'expected {expected} statements, ran {counter.count}:\n' + '\n'.join(counter.statements)
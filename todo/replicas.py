@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import os
+from sqlalchemy import text
+import sqlite_profile
+
+'''
+Read replicas, used only when DATABASE_REPLICA_URLS environment variable is set (comma separated urls, same schema as
+primary, kept up to date by the database's own replication). Without it everything goes to the primary as before.
+
+Sessions of GET requests are marked read-only (check get_db and RoutingSession in database.py), their plain SELECTs
+go to a replica, picked round-robin. One session stays on the replica it picked first, so one request never mixes data
+of two replicas.
+Writes, SELECT ... FOR UPDATE, raw text() statements (health check) and sessions of all other methods use the primary.
+
+Replicas which fail 'SELECT 1' are skipped until they answer again (checked every REPLICA_CHECK_INTERVAL seconds while
+the app runs), when no replica is healthy reads go to the primary.
+
+Replicas lag a little behind the primary, so a user who just changed something could read the old state back, for example
+the todo page loaded right after 'create_todo'. Every successful write request sets a short cookie (PRIMARY_COOKIE,
+READ_YOUR_WRITES_SECONDS) and GET requests carrying it read from the primary. The cookie works across workers, API
+clients get it as well (keep the cookies, like browsers and httpx/requests sessions do).
+'''
+
+REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))        # seconds between health checks
+REPLICA_CHECK_TIMEOUT = float(os.getenv('REPLICA_CHECK_TIMEOUT', '2'))          # seconds, slower replica counts as down
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', '10'))     # should be more than the usual replication lag
+PRIMARY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaSet:
+
+    def __init__(self):
+        self.engines = []
+        self.healthy = {}  # engine -> bool
+        self._next = itertools.count()
+        self._task = None
+
+    def configure(self, engines: list):
+        self.engines = list(engines)
+        self.healthy = {engine: True for engine in self.engines} # trusted until first failed check
+
+    def choose(self):
+        '''
+        Next healthy replica engine (round-robin), None when there is none.
+        '''
+        healthy = [engine for engine in self.engines if self.healthy.get(engine)]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    async def ping(self, engine) -> bool:
+        try:
+            async with sqlite_profile.read_only_engine(engine).connect() as connection:
+                await asyncio.wait_for(connection.execute(text('SELECT 1')), REPLICA_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def check(self):
+        for engine, healthy in zip(self.engines, await asyncio.gather(*(self.ping(engine) for engine in self.engines))):
+            self.healthy[engine] = healthy
+
+    async def _check_forever(self, interval: float):
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = REPLICA_CHECK_INTERVAL):
+        if self.engines and self._task is None:
+            self._task = asyncio.create_task(self._check_forever(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+        self.configure([])
+
+
+replicas = ReplicaSet()
+
+
+def reads_from_replica(request) -> bool:
+    return request.method in SAFE_METHODS and PRIMARY_COOKIE not in request.cookies
+
+
+class ReadYourWritesMiddleware:
+    '''
+    Plain ASGI middleware, sets PRIMARY_COOKIE on successful responses of write requests, check the top of this file.
+    '''
+
+    def __init__(self, app, seconds: int = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.cookie = f'{PRIMARY_COOKIE}=1; Max-Age={seconds}; Path=/; HttpOnly; SameSite=Lax'.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] in SAFE_METHODS or not replicas.engines:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                message['headers'] = list(message.get('headers', [])) + [(b'set-cookie', self.cookie)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,9 +1,22 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Path, Query
+import csv
+import io
+import json
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Path, Query, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from starlette import status
 from models import Todos
-from database import SessionLocal
-from typing import Annotated
-from sqlalchemy.orm import Session
+from database import get_db, get_sessionmaker, pool_stats
+from pagination import TodoPage
+from shard_map import shards
+from sharding import scatter
+from todo_events import todo_events
+from etag import bump_version
+from profiling import profile_store
+from stats import change_stats, global_stats, owner_stats, rebuild_stats, todo_delta
+from schemas import PartialTodoResponse, todo_fields, columns, pick
+from typing import Annotated, Literal, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from pydantic import BaseModel, Field
 from routers.auth import get_current_user
 
@@ -12,22 +25,56 @@ router = APIRouter(
     tags = ['admin']
 )
 
-# create db dependency 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db 
-    finally:
-        db.close
-
-db_dependency = Annotated[Session, Depends(get_db)] 
+db_dependency = Annotated[AsyncSession, Depends(get_db)] 
 user_dependency = Annotated[dict, Depends(get_current_user)]
+page_dependency = Annotated[TodoPage, Depends()]
+fields_dependency = Annotated[tuple, Depends(todo_fields)]
+sessionmaker_dependency = Annotated[async_sessionmaker, Depends(get_sessionmaker)]
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = (Todos.id, Todos.title, Todos.description, Todos.priority, Todos.complete, Todos.owner_id)
+
+@router.get("/todo/", status_code= status.HTTP_200_OK, response_model= list[PartialTodoResponse], response_model_exclude_unset= True)
+async def read_all(user: user_dependency, db : db_dependency, page : page_dependency, fields : fields_dependency, response : Response):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = "Authentication Failed")
+    selected = fields + tuple(field for field in page.key_fields() if field not in fields)
+    # with sharding every shard returns its own page, they are merged here into one
+    rows = page.merge(await scatter(db, page.apply(select(*columns(Todos, selected)))))
+    return [pick(row, fields) for row in page.page(rows, response)]
+
 
-@router.get("/todo/", status_code= status.HTTP_200_OK)
-async def read_all(user: user_dependency, db : db_dependency):
+async def export_todos(session_factory, export_format : str):
+    '''
+    Yields export file in chunks, one chunk per batch of EXPORT_BATCH_SIZE rows.
+    'yield_per' makes database driver use server side cursor, so only one batch of rows is in memory at a time
+    and plain rows (not ORM objects) are read, whatever the size of todos table.
+    With sharding shards are exported one after another, rows are ordered by id inside each shard.
+    '''
+    if export_format == 'csv':
+        yield ','.join(column.key for column in EXPORT_COLUMNS) + '\r\n' # header goes out before the query even starts
+    async with session_factory(info={'read_only': True}) as db:
+        for shard in shards.names():
+            result = await db.stream(select(*EXPORT_COLUMNS).order_by(Todos.id).execution_options(yield_per = EXPORT_BATCH_SIZE),
+                                     bind_arguments = {'shard': shard})
+            async for rows in result.partitions():
+                if export_format == 'csv':
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(json.dumps(row._asdict()) + '\n' for row in rows)
+
+
+# endpoint for admin to download all todos, response is streamed so big tables do not need to fit in memory
+@router.get("/todo/export", status_code= status.HTTP_200_OK)
+async def export_all(user: user_dependency, session_factory : sessionmaker_dependency,
+                     export_format : Literal['ndjson', 'csv'] = Query('ndjson', alias = 'format')):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code= 401, detail = "Authentication Failed")
-    return db.query(Todos).all()
+    media_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(export_todos(session_factory, export_format), media_type = media_type,
+                             headers = {'Content-Disposition': f'attachment; filename="todos.{export_format}"'})
 
 
 # create delete endpoint for admin
@@ -35,8 +82,61 @@ async def read_all(user: user_dependency, db : db_dependency):
 async def delete_todo(user: user_dependency, db : db_dependency, todo_id : int = Path(gt=0)):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code= 401, detail = 'Authentication Failed')
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
-    if todo_model is None:
+    # DELETE ... RETURNING owner_id, one statement instead of SELECT + DELETE
+    # with sharding admin does not know the owner (and so the shard), shards are tried one by one, ids are unique over all
+    for shard in shards.names():
+        deleted = (await db.execute(delete(Todos).where(Todos.id == todo_id).returning(Todos.owner_id, Todos.complete, Todos.priority),
+                                    bind_arguments = {'shard': shard})).first()
+        if deleted is not None:
+            break
+    if deleted is None:
         raise HTTPException(status_code=404, detail = "Todo Not Found")
-    db.query(Todos).filter(Todos.owner_id == todo_id).delete()
-    db.commit()
\ No newline at end of file
+    shards.route(db, deleted.owner_id, write = True) # stats are in the same shard, nothing is committed if bucket is moving
+    await change_stats(db, deleted.owner_id, todo_delta([deleted], -1))
+    await bump_version(db, deleted.owner_id)
+    await db.commit()
+    await todo_events.publish(deleted.owner_id, 'deleted', [{'id': todo_id}])
+
+# todo counts of all users together, or of one user with ?owner_id=, read from todo_stats, check stats.py
+@router.get("/stats", status_code = status.HTTP_200_OK)
+async def read_stats(user: user_dependency, db : db_dependency, owner_id : Optional[int] = Query(None, gt = 0)):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = 'Authentication Failed')
+    if owner_id is not None:
+        return await owner_stats(shards.route(db, owner_id), owner_id)
+    return await global_stats(db)
+
+# recounts todo_stats from todos (full scan of todos), same as 'python -m stats rebuild'
+@router.post("/stats/rebuild", status_code = status.HTTP_200_OK)
+async def rebuild_todo_stats(user: user_dependency, db : db_dependency):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = 'Authentication Failed')
+    return {'users': await rebuild_stats(db)}
+
+# endpoint for admin to see live connection pool numbers(checked out connections, overflow, wait time)
+@router.get("/pool", status_code = status.HTTP_200_OK)
+async def read_pool_stats(user: user_dependency):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = 'Authentication Failed')
+    return pool_stats()
+
+# request profiles taken with 'X-Profile: 1' header, check profiling.py
+@router.get("/profiles", status_code = status.HTTP_200_OK)
+async def read_profiles(user: user_dependency):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = 'Authentication Failed')
+    return profile_store.list()
+
+@router.get("/profiles/{profile_id}", status_code = status.HTTP_200_OK)
+async def read_profile(user: user_dependency, profile_id : str,
+                       profile_format : Literal['text', 'pstats'] = Query('text', alias = 'format'),
+                       sort : Literal['cumulative', 'tottime', 'calls'] = 'cumulative'):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code= 401, detail = 'Authentication Failed')
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail = "Profile Not Found")
+    if profile_format == 'pstats':
+        return Response(profile.dump(), media_type = 'application/octet-stream',
+                        headers = {'Content-Disposition': f'attachment; filename="{profile_id}.pstats"'})
+    return PlainTextResponse(profile.text(sort))
@@ -4,11 +4,13 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from models import Users
 from jose import jwt, JWTError
-from database import SessionLocal 
-from sqlalchemy.orm import Session
+from database import get_db
+from token_cache import token_cache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from passlib.context import CryptContext # needed for hashing password
-from fastapi.templating import Jinja2Templates
+from hashing import hash_password, verify_password # bcrypt work runs in process pool, check hashing.py
+from pages import templates # jinja2 is loaded on first page render, check pages.py
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 # 'OAuth2PasswordRequestForm' needed to get username and password from user, it's not normal fast api form, 
 # it's special kind of form called OAuth to password , more secure and have it's own portal on swagger
@@ -32,43 +34,29 @@ SECRET_KEY = 'a20e001d5dd1b5a5c3fb64530506846e9726acad2a32658f24cc92b66876a84a'
                                                                                 # this is just a unique string required to create JWT token
 ALGORITHM = 'HS256'
 
-bcrypt_context = CryptContext(schemes = ['bcrypt'], deprecated = 'auto')
-
 # create dependency 
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl = 'auth/token') # here tokenUrl is what client will send in it's request url
 
-# create db dependency 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db # code inside try block will executed before sending the response to user, and code inside finally block will be executed 
-                 # once response delivered.This makes fastapi fast and quicker. we fetch the data from database return it to client and then 
-                 # close the database after, and it's safer because we are only opening the db connecting when using it then closing it after.
-    finally:
-        db.close
-
-templates = Jinja2Templates(directory = "templates")
-
 #### pages ####
 @router.get("/login-page")
 def render_login_page(request:Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return templates().TemplateResponse("login.html", {"request": request})
 
 @router.get("/register-page")
 def render_register_page(request:Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return templates().TemplateResponse("register.html", {"request": request})
 
 ### Endpoints ###
-def authenticate_user(username: str, password: str, db):
+async def authenticate_user(username: str, password: str, db):
     '''
     This function validates user with their username and password
     returns user if validated else False
     '''
-    user = db.query(Users).filter(Users.username == username).first() # returned user is a complete object of Users class, containing all the fields of a user like, id, username, email .... etc
+    user = (await db.execute(select(Users).where(Users.username == username))).scalars().first() # returned user is a complete object of Users class, containing all the fields of a user like, id, username, email .... etc
     if not user:
         return False
     #Below code is checking that the password sent by user and the existing password in db for that user is matching or not when user is logging in
-    if not bcrypt_context.verify(password, user.hashed_password): # 'hashed_password' - exists in db , 'password'- sent by user to login.
+    if not await verify_password(password, user.hashed_password): # 'hashed_password' - exists in db , 'password'- sent by user to login.
         return False
     return user
 
@@ -84,6 +72,11 @@ def create_access_token(username: str, user_id: int, role : str, expires_delta:
     return jwt.encode(encode, SECRET_KEY, algorithm = ALGORITHM)
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+    # token which was already verified is taken from cache, no need to decode it again, check token_cache.py
+    if isinstance(token, str):
+        user = token_cache.get(token)
+        if user is not None:
+            return user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms= [ALGORITHM])
         username : str = payload.get('sub')
@@ -91,14 +84,16 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
         user_role : str = payload.get('role')
         if username is None or user_id is None:
             raise HTTPException(status_code= status.HTTP_401_UNAUTHORIZED, detail = "Could Not Validate User.")
-        return {'username':username, 'id':user_id, 'user_role': user_role}
+        user = {'username':username, 'id':user_id, 'user_role': user_role}
+        token_cache.put(token, user, payload.get('exp'))
+        return user
     except JWTError:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = 'Could NOt Validate User')
         
 
 # now before each request we need to be able to fetch this DB session SessionLocal and be able to open the connection and close 
 # the connection on every request sent  to this FastAPI application.
-db_dependency = Annotated[Session, Depends(get_db)] 
+db_dependency = Annotated[AsyncSession, Depends(get_db)] 
 
 # Create a pydantic model to validate the fields sent by user to create a new user
 class CreateUserRequest(BaseModel):
@@ -126,7 +121,7 @@ async def craete_user(db : db_dependency, create_user_request : CreateUserReques
         email = create_user_request.email,
         first_name = create_user_request.first_name,
         last_name = create_user_request.last_name,
-        hashed_password = bcrypt_context.hash(create_user_request.password), # a average developer would not be able to know what is this .hash() function alogorithm is 
+        hashed_password = await hash_password(create_user_request.password), # a average developer would not be able to know what is this .hash() function alogorithm is 
         role = create_user_request.role,
         is_active = True,
         phone_number = create_user_request.phone_number
@@ -134,7 +129,7 @@ async def craete_user(db : db_dependency, create_user_request : CreateUserReques
     )
 
     db.add(create_user_model)
-    db.commit()
+    await db.commit()
 
 # Creating endpoint to receive username and password from user
 # @router.post("/token")
@@ -151,7 +146,7 @@ async def craete_user(db : db_dependency, create_user_request : CreateUserReques
 async def login_for_access_token(form_data : Annotated[OAuth2PasswordRequestForm, Depends()],
                                  db : db_dependency):
     
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = 'Could NOt Validate User')
     token = create_access_token(user.username, user.id, user.role, timedelta(minutes=20))
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Path, Query, Request, status
+from fastapi import FastAPI, APIRouter, Body, Depends, HTTPException, Path, Query, Request, Response, status
 from starlette import status # Depends is used for dependency injection
 # Dependency injection in programming means that we need to do something before we execute what we are trying to execute, 
 # and that will allow us to do some kind of code behind the scenes and then inject the dependency that that function relies on
@@ -6,37 +6,47 @@ from starlette import status # Depends is used for dependency injection
 # then return that information back to us and then closing the session behind scenes.
 # from  models import Todos
 from models import Todos
-from database import SessionLocal
+from database import get_db, get_sessionmaker
+from group_commit import group_commits
+from shard_map import shards
+from sharding import assign_todo_ids
+from pagination import TodoPage
+from search import SearchPage, ranked_select
+from stats import change_stats, owner_stats, todo_delta
+from todo_cache import todo_cache
+from todo_events import todo_events, event_stream
+from schemas import PartialTodoResponse, TODO_COLUMNS, todo_fields, columns, pick
+from etag import bump_version, owner_version, make_etag, not_modified, expected_version, todo_etag
 from typing import Annotated
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from pydantic import BaseModel, Field
 from routers.auth import get_current_user
-from starlette.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
-
-templates = Jinja2Templates(directory="templates")
+from starlette.responses import RedirectResponse, StreamingResponse
+from pages import templates # jinja2 is loaded on first page render, check pages.py
 
 router = APIRouter(
     prefix="/todos",
     tags=["todos"]
 )
 
-# create db dependency 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db # code inside try block will executed before sending the response to user, and code inside finally block will be executed 
-                 # once response delivered.This makes fastapi fast and quicker. we fetch the data from database return it to client and then 
-                 # close the database after, and it's safer because we are only opening the db connecting when using it then closing it after.
-    finally:
-        db.close
-
 # now before each request we need to be able to fetch this DB session SessionLocal and be able to open the connection and close 
 # the connection on every request sent  to this FastAPI application.
 
-db_dependency = Annotated[Session, Depends(get_db)] # This is the cool thing about FastAPI, we can create db dependency just using simple Annotated
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+async def get_owner_db(user : user_dependency, db : Annotated[AsyncSession, Depends(get_db)], request : Request):
+    # every query here is scoped by owner, so with sharding the whole session goes to the owner's shard, check shard_map.py
+    if user is not None:
+        shards.route(db, user.get('id'), write = request.method not in ('GET', 'HEAD'))
+    return db
+
+db_dependency = Annotated[AsyncSession, Depends(get_owner_db)] # This is the cool thing about FastAPI, we can create db dependency just using simple Annotated
+page_dependency = Annotated[TodoPage, Depends()]
+sessionmaker_dependency = Annotated[async_sessionmaker, Depends(get_sessionmaker)]
+search_dependency = Annotated[SearchPage, Depends()]
+fields_dependency = Annotated[tuple, Depends(todo_fields)]
+
 # create pydantic model to accept request to create new todos, will include some validations for the fields 
 
 class TodoRequest(BaseModel):
@@ -52,6 +62,16 @@ class TodoRequest(BaseModel):
     priority : int = Field(gt= 0, lt= 6)
     complete : bool     # validation not needed either True or False
 
+# batch update needs id of every todo along with new values
+class TodoUpdateRequest(TodoRequest):
+    id : int = Field(gt= 0)
+
+MAX_BATCH_SIZE = 1000 # one batch request can not contain more than this many todos
+
+# pages read the user from the access_token cookie, not from Authorization header, so they can not use db_dependency
+# (get_owner_db needs get_current_user), they route the session to the user's shard themselves
+page_db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
 def redirect_to_login():
     redirect_response = RedirectResponse(url="/auth/login-page", status_code=status.HTTP_302_FOUND)
     redirect_response.delete_cookie(key="access_token")
@@ -60,14 +80,20 @@ def redirect_to_login():
 ### Pages ###
 
 @router.get("/todo-page")
-async def render_todo_page(request: Request, db: db_dependency):
+async def render_todo_page(request: Request, db: page_db_dependency):
     try:
         user = await get_current_user(request.cookies.get('access_token'))
         if user is None:
             return redirect_to_login()
-        todos = db.query(Todos).filter(Todos.owner_id == user.get("id")).all()
+        shards.route(db, user.get("id"))
+        # whole list of the user is cached under user's version, database is queried only after user changed a todo, check todo_cache.py
+        cache_key = todo_cache.key(user.get("id"), await owner_version(db, user.get("id")), 'page')
+        todos = await todo_cache.get(cache_key)
+        if todos is None:
+            todos = [row._asdict() for row in (await db.execute(select(*TODO_COLUMNS).where(Todos.owner_id == user.get("id")))).all()]
+            await todo_cache.set(cache_key, todos)
 
-        return templates.TemplateResponse("todo.html", {"request": request, "todos":todos, "user": user})
+        return templates().TemplateResponse("todo.html", {"request": request, "todos":todos, "user": user})
     except:
         return redirect_to_login()
     
@@ -78,75 +104,229 @@ async def render_todo_page(request: Request):
 
         if user is None:
             return redirect_to_login()
-        return templates.TemplateResponse('add-todo.html', {"request": request, "user": user})
+        return templates().TemplateResponse('add-todo.html', {"request": request, "user": user})
     except:
         return redirect_to_login()
     
 @router.get("/edit-todo-page/{todo_id}")
-async def render_edit_todo_page(request: Request, todo_id: int, db: db_dependency):
+async def render_edit_todo_page(request: Request, todo_id: int, db: page_db_dependency):
     try:
         user = await get_current_user(request.cookies.get("access_token"))
 
         if user is None:
             return redirect_to_login()
-        todo = db.query(Todos).filter(Todos.id == todo_id).first()
-        return templates.TemplateResponse('edit-todo.html', {"request": request, "todo":todo, "user":user})
+        shards.route(db, user.get("id"))
+        todo = (await db.execute(select(Todos).where(Todos.id == todo_id))).scalars().first()
+        return templates().TemplateResponse('edit-todo.html', {"request": request, "todo":todo, "user":user})
     except:
         return redirect_to_login()
 
 
 ### Endpoints ###
 # Create asynchronous api endpoint 
-@router.get("/", status_code= status.HTTP_200_OK)
-async def read_all(user : user_dependency, db: db_dependency):
+@router.get("/", status_code= status.HTTP_200_OK, response_model= list[PartialTodoResponse], response_model_exclude_unset= True)
+async def read_all(user : user_dependency, db: db_dependency, page : page_dependency, fields : fields_dependency,
+                   request : Request, response : Response):
     if user is None:
         raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-    return db.query(Todos).filter(Todos.owner_id == user.get('id')).all() #this is SQLAlchemy syntax in context of ORM which will return all the object defined in Todo class.
+    variant = f"{page.cache_key()}&fields={','.join(fields)}"
+    # if client already has this version of the list, answer 304 without reading todos, check etag.py
+    version = await owner_version(db, user.get('id'))
+    if version is not None:
+        etag = make_etag('todos', user.get('id'), version, variant)
+        if (cached_response := not_modified(request, etag)) is not None:
+            return cached_response
+        response.headers['ETag'] = etag
+    # cached lists are keyed by the same version as the ETag, so a list of other version is never sent under this ETag
+    cache_key = todo_cache.key(user.get('id'), version, variant)
+    cached = await todo_cache.get(cache_key)
+    if cached is not None:
+        if cached['next'] is not None:
+            response.headers['X-Next-Cursor'] = cached['next']
+        return cached['todos']
+    # only one page (default 50 todos) is loaded, cursor for next page is sent back in 'X-Next-Cursor' header, check pagination.py
+    # only asked fields (plus the ones needed for cursor) are selected, rows are plain tuples (no ORM objects), check schemas.py
+    selected = fields + tuple(field for field in page.key_fields() if field not in fields)
+    query = page.apply(select(*columns(Todos, selected)).where(Todos.owner_id == user.get('id')))
+    todos = [pick(row, fields) for row in page.page((await db.execute(query)).all(), response)]
+    await todo_cache.set(cache_key, {'todos': todos, 'next': response.headers.get('X-Next-Cursor')})
+    return todos
 
-@router.get("/todo/{todo_id}", status_code= status.HTTP_200_OK)
-async def read_todo(user : user_dependency, db : db_dependency, todo_id : int = Path(gt=0)):
+@router.get("/todo/{todo_id}", status_code= status.HTTP_200_OK, response_model= PartialTodoResponse, response_model_exclude_unset= True)
+async def read_todo(user : user_dependency, db : db_dependency, fields : fields_dependency, request : Request, response : Response,
+                    todo_id : int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).first()
-    if todo_model is not None:
-        return todo_model
-    raise HTTPException(status_code= 404, detail= 'Todo Not Found')
+    # ETag is the todo's own version, the same value PUT/DELETE accept back in 'If-Match', check etag.py
+    selected = fields + (('version',) if 'version' not in fields else ())
+    todo_model = (await db.execute(select(*columns(Todos, selected)).where(Todos.id == todo_id).where(Todos.owner_id == user.get('id')))).first()
+    if todo_model is None:
+        raise HTTPException(status_code= 404, detail= 'Todo Not Found')
+    etag = todo_etag(todo_model.version)
+    if (cached_response := not_modified(request, etag)) is not None:
+        return cached_response
+    response.headers['ETag'] = etag
+    return pick(todo_model, fields)
+
+# full text search in title and description of user's todos, best matches first, check search.py
+@router.get("/search", status_code= status.HTTP_200_OK, response_model= list[PartialTodoResponse], response_model_exclude_unset= True)
+async def search_todos(user : user_dependency, db : db_dependency, search : search_dependency, fields : fields_dependency,
+                       response : Response):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    if not search.terms:
+        return []
+    selected = fields + (('id',) if 'id' not in fields else ())
+    query = search.apply(ranked_select(db.get_bind(Todos).dialect.name, user.get('id'), search.terms, columns(Todos, selected)))
+    return [pick(row, fields) for row in search.page((await db.execute(query)).all(), response)]
+
+# live changes of user's todos as server-sent events (created/updated/deleted), todo page listens to it, check todo_events.py
+@router.get("/events", status_code= status.HTTP_200_OK)
+async def stream_events(user : user_dependency, request : Request):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    todo_events.check_room(user.get('id')) # 429 before the stream starts, subscriber itself is made inside the stream
+    return StreamingResponse(event_stream(todo_events, user.get('id'), request), media_type = 'text/event-stream',
+                             headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}) # no buffering in nginx
+
+def todo_event(todo_id, todo_request, owner_id, version = 1) -> dict:
+    return {**todo_request.model_dump(exclude = {'id'}), 'id': todo_id, 'owner_id': owner_id, 'version': version}
+
+# counts of user's todos (total, completed, per priority), one primary key lookup in todo_stats, check stats.py
+@router.get("/stats", status_code= status.HTTP_200_OK)
+async def read_stats(user : user_dependency, db : db_dependency):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    return await owner_stats(db, user.get('id'))
 
 # create post request to receive request to create new todo
 @router.post("/todo", status_code= status.HTTP_201_CREATED)
-async def create_todo(user : user_dependency, db: db_dependency, todo_request : TodoRequest):
+async def create_todo(user : user_dependency, db: db_dependency, todo_request : TodoRequest, session_factory : sessionmaker_dependency):
     if user is None:
         raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-    todo_model = Todos(**todo_request.model_dump(), owner_id = user.get('id'))
+    if group_commits.enabled:
+        # written and committed together with other creates of the same few milliseconds, check group_commit.py
+        todo_id = await group_commits.submit(session_factory, user.get('id'), todo_request)
+    else:
+        todo_model = Todos(**todo_request.model_dump(), owner_id = user.get('id'))
+        await assign_todo_ids([todo_model])
+
+        db.add(todo_model)
+        await change_stats(db, user.get('id'), todo_delta([todo_request]))
+        await bump_version(db, user.get('id'))
+        await db.commit()
+        todo_id = todo_model.id
+    await todo_events.publish(user.get('id'), 'created', [todo_event(todo_id, todo_request, user.get('id'))])
 
-    db.add(todo_model)
-    db.commit()
+async def raise_not_found_or_conflict(db, user, todo_id, version):
+    '''
+    Called only when UPDATE/DELETE changed no row. Without If-Match it is simply 404, with If-Match we check
+    if todo exists, if it does, someone else changed it after client read it (412).
+    '''
+    if version is not None:
+        current = (await db.execute(select(Todos.version).where(Todos.id == todo_id).where(Todos.owner_id == user.get('id')))).scalar()
+        if current is not None:
+            raise HTTPException(status_code= status.HTTP_412_PRECONDITION_FAILED, detail= "Todo Was Changed",
+                                headers= {'ETag': todo_etag(current)})
+    raise HTTPException(status_code= 404, detail= "Todo Not Found")
 
 # Create update method to update existing todo for a given todo_id
 @router.put("/todo/{todo_id}", status_code= status.HTTP_204_NO_CONTENT)
-async def update_todo(user : user_dependency, db : db_dependency, todo_request : TodoRequest, todo_id : int = Path(gt=0)):
+async def update_todo(user : user_dependency, db : db_dependency, todo_request : TodoRequest, request : Request,
+                      response : Response, todo_id : int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).first()
-    if not todo_model:
-        raise HTTPException(status_code= 404, detail= "Todo Not Found")
-    todo_model.title = todo_request.title
-    todo_model.description = todo_request.description
-    todo_model.priority = todo_request.priority
-    todo_model.complete = todo_request.complete
-
-    db.add(todo_model)
-    db.commit()
+    # UPDATE ... WHERE id AND owner_id RETURNING. If nothing came back todo does not exist
+    # (or belongs to other user, or has other version than client sent in If-Match).
+    # stats counters are corrected by a database trigger from old and new values, check TODO_STATS_DDL in models.py
+    query = update(Todos).where(Todos.id == todo_id).where(Todos.owner_id == user.get('id'))
+    version = expected_version(request)
+    if version is not None:
+        query = query.where(Todos.version == version)
+    new_version = (await db.execute(query.values(**todo_request.model_dump(), version = Todos.version + 1)
+                                    .returning(Todos.version))).scalar()
+    if new_version is None:
+        await raise_not_found_or_conflict(db, user, todo_id, version)
+    response.headers['ETag'] = todo_etag(new_version)
+    await bump_version(db, user.get('id'))
+    await db.commit()
+    await todo_events.publish(user.get('id'), 'updated', [todo_event(todo_id, todo_request, user.get('id'), new_version)])
 
 # create delete method to delete an existing todo for a given todo_id
 @router.delete("/todo/{todo_id}", status_code= status.HTTP_204_NO_CONTENT)
-async def todo_delete(user : user_dependency, db : db_dependency, todo_id : int = Path(gt=0)):
+async def todo_delete(user : user_dependency, db : db_dependency, request : Request, todo_id : int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-    todo_model = db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).first()
-    if not todo_model:
-        raise HTTPException(status_code= 404, detail= "Todo Not Found")
-    
-    db.query(Todos).filter(Todos.id == todo_id).filter(Todos.owner_id == user.get('id')).delete()
-    db.commit()
+    query = delete(Todos).where(Todos.id == todo_id).where(Todos.owner_id == user.get('id'))
+    version = expected_version(request)
+    if version is not None:
+        query = query.where(Todos.version == version)
+    deleted = (await db.execute(query.returning(Todos.complete, Todos.priority))).first()
+    if deleted is None:
+        await raise_not_found_or_conflict(db, user, todo_id, version)
+    await change_stats(db, user.get('id'), todo_delta([deleted], -1))
+    await bump_version(db, user.get('id'))
+    await db.commit()
+    await todo_events.publish(user.get('id'), 'deleted', [{'id': todo_id}])
+
+
+### Batch Endpoints ###
+# Importers and sync clients send thousands of todos, with batch endpoints they are written with one statement and one
+# commit for the whole list instead of one request + one commit per todo. Response has one result per item in the same order.
 
+@router.post("/batch", status_code= status.HTTP_200_OK)
+async def create_todos(user : user_dependency, db : db_dependency,
+                       todo_requests : Annotated[list[TodoRequest], Body(min_length= 1, max_length= MAX_BATCH_SIZE)]):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    rows = [{**todo_request.model_dump(), 'owner_id': user.get('id')} for todo_request in todo_requests]
+    await assign_todo_ids(rows)
+    # one multi row INSERT ... RETURNING id, ids come back in the same order as rows
+    ids = (await db.execute(insert(Todos).returning(Todos.id, sort_by_parameter_order= True), rows)).scalars().all()
+    await change_stats(db, user.get('id'), todo_delta(todo_requests))
+    await bump_version(db, user.get('id'))
+    await db.commit()
+    await todo_events.publish(user.get('id'), 'created', [todo_event(todo_id, todo_request, user.get('id'))
+                                                          for todo_id, todo_request in zip(ids, todo_requests)])
+    return [{'id': todo_id, 'status': status.HTTP_201_CREATED} for todo_id in ids]
+
+@router.put("/batch", status_code= status.HTTP_200_OK)
+async def update_todos(user : user_dependency, db : db_dependency,
+                       todo_requests : Annotated[list[TodoUpdateRequest], Body(min_length= 1, max_length= MAX_BATCH_SIZE)]):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    ids = [todo_request.id for todo_request in todo_requests]
+    # only user's own todos are updated, todos of other users are reported as not found
+    # versions are read (and rows locked) for events, stats counters are corrected by a trigger (TODO_STATS_DDL in models.py)
+    owned = {row.id: row for row in (await db.execute(select(Todos.id, Todos.version).where(Todos.id.in_(ids))
+                                                      .where(Todos.owner_id == user.get('id')).with_for_update())).all()}
+    rows = [todo_request.model_dump() for todo_request in todo_requests if todo_request.id in owned]
+    if rows:
+        latest = {todo_request.id: todo_request for todo_request in todo_requests if todo_request.id in owned} # last one wins
+        # ORM bulk UPDATE by primary key, owner_id condition is added to every row's WHERE as well
+        await db.execute(update(Todos).where(Todos.owner_id == user.get('id')), rows,
+                         execution_options= {'synchronize_session': None}) # no loaded objects in this session to sync
+        await db.execute(update(Todos).where(Todos.id.in_(list(owned))).values(version = Todos.version + 1))
+        await bump_version(db, user.get('id'))
+        await db.commit()
+        await todo_events.publish(user.get('id'), 'updated', [todo_event(todo_id, todo_request, user.get('id'), owned[todo_id].version + 1)
+                                                              for todo_id, todo_request in latest.items()])
+    return [{'id': todo_id, 'status': status.HTTP_204_NO_CONTENT if todo_id in owned else status.HTTP_404_NOT_FOUND}
+            for todo_id in ids]
+
+@router.post("/batch/delete", status_code= status.HTTP_200_OK)
+async def delete_todos(user : user_dependency, db : db_dependency,
+                       todo_ids : Annotated[list[Annotated[int, Field(gt= 0)]], Body(min_length= 1, max_length= MAX_BATCH_SIZE)]):
+    if user is None:
+        raise HTTPException(status_code = 401, detail = 'Authentication Failed')
+    deleted_rows = (await db.execute(delete(Todos).where(Todos.id.in_(todo_ids)).where(Todos.owner_id == user.get('id'))
+                                     .returning(Todos.id, Todos.complete, Todos.priority))).all()
+    deleted = {row.id for row in deleted_rows}
+    if deleted:
+        await change_stats(db, user.get('id'), todo_delta(deleted_rows, -1))
+        await bump_version(db, user.get('id'))
+    await db.commit()
+    if deleted:
+        await todo_events.publish(user.get('id'), 'deleted', [{'id': todo_id} for todo_id in deleted])
+    return [{'id': todo_id, 'status': status.HTTP_204_NO_CONTENT if todo_id in deleted else status.HTTP_404_NOT_FOUND}
+            for todo_id in todo_ids]
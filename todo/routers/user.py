@@ -1,29 +1,24 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Path, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Path, Query, Request, Response
 from starlette import status
 from models import Users
-from database import SessionLocal
+from database import get_db
 from typing import Annotated
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 from routers.auth import get_current_user
-from passlib.context import CryptContext
+from hashing import hash_password, verify_password
+from etag import owner_version, make_etag, not_modified
+from schemas import PartialUserResponse, user_fields, columns
 
 router = APIRouter(
     prefix = "/user", 
     tags = ['user']
 )
 
-# create db dependency 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db 
-    finally:
-        db.close
-
-db_dependency = Annotated[Session, Depends(get_db)] 
+db_dependency = Annotated[AsyncSession, Depends(get_db)] 
 user_dependency = Annotated[dict, Depends(get_current_user)]
-bcrypt_context = CryptContext(schemes = ['bcrypt'], deprecated = 'auto')
+fields_dependency = Annotated[tuple, Depends(user_fields)]
 
 # create a pydantic model to validate the new password(provided by user) while changing the old password
 class UserVerification(BaseModel):
@@ -31,35 +26,47 @@ class UserVerification(BaseModel):
     new_password : str =Field(min_length=6)
 
 # create user endpoint to get all the information for the user
-@router.get("/", status_code=status.HTTP_200_OK)
-async def read_all(user : user_dependency, db : db_dependency):
+@router.get("/", status_code=status.HTTP_200_OK, response_model=PartialUserResponse, response_model_exclude_unset=True)
+async def read_all(user : user_dependency, db : db_dependency, fields : fields_dependency, request : Request, response : Response):
     if user is None:
         raise HTTPException(status_code=401, detail = "Authentication Failed")
-    todo_model = db.query(Users).filter(Users.id == user.get('id')).first()
+    # only when client sends ETag it has, we check version first and skip loading the user if nothing changed
+    if request.headers.get('if-none-match') is not None:
+        version = await owner_version(db, user.get('id'))
+        if version is not None and (cached_response := not_modified(request, make_etag('user', user.get('id'), version, ','.join(fields)))) is not None:
+            return cached_response
+    # hashed_password is not selected and never leaves the server, check schemas.py
+    todo_model = (await db.execute(select(Users.version, *columns(Users, fields)).where(Users.id == user.get('id')))).first()
     if todo_model is None:
         raise HTTPException(status_code=404, detail = "User Not Found")
-    return todo_model
+    response.headers['ETag'] = make_etag('user', user.get('id'), todo_model.version, ','.join(fields))
+    return {field: value for field, value in todo_model._asdict().items() if field != 'version'}
 
 #create endpoint to change password of a user
 @router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
 async def change_password(user : user_dependency, db : db_dependency, user_verification : UserVerification):
     if user is None:
         raise HTTPException(status_code=401, detail = "Authentication Failed")
-    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
-    
-    if not bcrypt_context.verify(user_verification.password, user_model.hashed_password):
+    # old hash has to be read to verify the password, but only that one column. UPDATE has old hash in WHERE, so if password
+    # was changed by another request in between, nothing is updated and we answer same error.
+    old_hash = (await db.execute(select(Users.hashed_password).where(Users.id == user.get('id')))).scalar()
+    if old_hash is None or not await verify_password(user_verification.password, old_hash):
+        raise HTTPException(status_code=401, detail = "Error on Password change")
+    new_hash = await hash_password(user_verification.new_password)
+    updated = (await db.execute(update(Users).where(Users.id == user.get('id')).where(Users.hashed_password == old_hash)
+                                .values(hashed_password = new_hash, version = Users.version + 1).returning(Users.id))).scalar()
+    if updated is None:
         raise HTTPException(status_code=401, detail = "Error on Password change")
-    user_model.hashed_password = bcrypt_context.hash(user_verification.new_password)
-    db.add(user_model)
-    db.commit()
+    await db.commit()
 
 # create endpoint to add phone number
 @router.put("/phonenumber/{phone_number}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_phone_number(user : user_dependency, db : db_dependency, phone_number : str):
      if user is None:
          raise HTTPException(status_code = 401, detail = 'Authentication Failed')
-     user_model = db.query(Users).filter(Users.id == user.get('id')).first()
-     user_model.phone_number = phone_number
-     
-     db.add(user_model)
-     db.commit()
+     # single UPDATE ... RETURNING, version (for ETag) is increased in the same statement
+     updated = (await db.execute(update(Users).where(Users.id == user.get('id'))
+                                 .values(phone_number = phone_number, version = Users.version + 1).returning(Users.id))).scalar()
+     if updated is None:
+         raise HTTPException(status_code = 404, detail = 'User Not Found')
+     await db.commit()
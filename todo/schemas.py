@@ -0,0 +1,73 @@
+from typing import Optional
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, create_model
+from models import Todos, Users
+
+'''
+Response models of the read endpoints.
+Read queries select only these columns (TODO_COLUMNS / USER_COLUMNS) and get plain row tuples instead of ORM objects,
+row is turned into dict with row._asdict() and FastAPI validates it with these models and renders it with orjson.
+It also makes sure we never send a column which is not listed here (for example users.hashed_password).
+'''
+
+class TodoResponse(BaseModel):
+    id : int
+    title : str
+    description : Optional[str] = None
+    priority : int
+    complete : bool
+    owner_id : int
+    version : int = 1
+
+
+class UserResponse(BaseModel):
+    id : int
+    username : str
+    email : Optional[str] = None
+    first_name : Optional[str] = None
+    last_name : Optional[str] = None
+    role : Optional[str] = None
+    phone_number : Optional[str] = None
+    is_active : Optional[bool] = None
+
+
+TODO_COLUMNS = tuple(getattr(Todos, field) for field in TodoResponse.model_fields)
+USER_COLUMNS = tuple(getattr(Users, field) for field in UserResponse.model_fields)
+
+
+'''
+Sparse fieldsets: client can ask only for the fields it needs, for example GET /todos/?fields=id,title
+Only those columns are selected from database and sent back. Partial models below have every field optional and
+endpoints use response_model_exclude_unset=True, so fields which were not asked are left out of the response.
+'''
+
+def partial_model(model):
+    return create_model(f'Partial{model.__name__}',
+                        **{name: (Optional[field.annotation], None) for name, field in model.model_fields.items()})
+
+PartialTodoResponse = partial_model(TodoResponse)
+PartialUserResponse = partial_model(UserResponse)
+
+
+def parse_fields(fields: Optional[str], model) -> tuple:
+    if fields is None:
+        return tuple(model.model_fields)
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - set(model.model_fields)
+    if not requested or unknown:
+        raise HTTPException(status_code = 400, detail = f"Invalid Fields: {', '.join(sorted(unknown)) or fields}")
+    return tuple(field for field in model.model_fields if field in requested) # keep model order
+
+
+def todo_fields(fields : Optional[str] = Query(None, description = 'comma separated fields to return, example: id,title')) -> tuple:
+    return parse_fields(fields, TodoResponse)
+
+def user_fields(fields : Optional[str] = Query(None, description = 'comma separated fields to return, example: username,email')) -> tuple:
+    return parse_fields(fields, UserResponse)
+
+
+def columns(model, fields) -> list:
+    return [getattr(model, field) for field in fields]
+
+def pick(row, fields) -> dict:
+    return {field: getattr(row, field) for field in fields}
@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import json
+import re
+from typing import Optional
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import column, func, literal_column, select, table, tuple_
+from models import Todos, TODO_SEARCH_DOCUMENT
+
+'''
+Full text search over todo titles and descriptions, used by GET /todos/search?q=...
+Index is kept by the database itself (check TODO_SEARCH_DDL in models.py), here we only build the ranked query:
+    postgres - ts_rank() of the tsvector expression, expression must be the same text as in the GIN index
+    sqlite   - bm25() of FTS5 table todos_fts, title counts twice as much as description
+Every word of the query must match (as a prefix, so 'gro' finds 'groceries'). Results are sorted by rank, best first,
+and paged with a cursor like the todo list (check pagination.py), cursor holds rank and id of the last result.
+'''
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_TERMS = 8
+
+
+def search_terms(q: str) -> list:
+    # only letters and digits are kept, so user input can never break tsquery / FTS5 query syntax
+    return re.findall(r'[^\W_]+', q.lower())[:MAX_TERMS]
+
+
+def ranked_select(dialect: str, owner_id, terms: list, selected: list):
+    '''
+    select(selected columns + 'rank') of owner's todos which match all terms, higher rank is better on both databases.
+    '''
+    if dialect == 'postgresql':
+        document = literal_column(f'({TODO_SEARCH_DOCUMENT})')
+        tsquery = func.to_tsquery(literal_column("'english'"), ' & '.join(f'{term}:*' for term in terms))
+        return (select(*selected, func.ts_rank(document, tsquery).label('rank'))
+                .where(document.op('@@')(tsquery)).where(Todos.owner_id == owner_id))
+    if dialect == 'sqlite':
+        todos_fts = table('todos_fts', column('rowid'))
+        return (select(*selected, literal_column('-bm25(todos_fts, 2.0, 1.0)').label('rank'))
+                .select_from(todos_fts).join(Todos, Todos.id == todos_fts.c.rowid)
+                .where(literal_column('todos_fts').op('MATCH')(' '.join(f'"{term}"*' for term in terms)))
+                .where(Todos.owner_id == owner_id))
+    raise HTTPException(status_code = 501, detail = 'Search Not Supported')
+
+
+class SearchPage:
+    '''
+    Query parameters of the search endpoint, used as dependency: search : Annotated[SearchPage, Depends()]
+    '''
+
+    def __init__(self,
+                 q : str = Query(min_length = 1, max_length = 200),
+                 limit : int = Query(DEFAULT_PAGE_SIZE, ge = 1, le = MAX_PAGE_SIZE),
+                 cursor : Optional[str] = Query(None)):
+        self.terms = search_terms(q)
+        self.limit = limit
+        self.cursor = cursor
+
+    def digest(self) -> str:
+        # cursor is valid only for the same search
+        return hashlib.sha256(' '.join(self.terms).encode()).hexdigest()[:12]
+
+    def encode_cursor(self, row) -> str:
+        key = {'q': self.digest(), 'r': row.rank, 'id': row.id}
+        return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self) -> dict:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(self.cursor + '=' * (-len(self.cursor) % 4)))
+            if key['q'] != self.digest() or not isinstance(key['id'], int) or not isinstance(key['r'], (int, float)):
+                raise ValueError
+            return key
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code = 400, detail = 'Invalid Cursor')
+
+    def apply(self, ranked):
+        '''
+        Wraps the ranked select, adds keyset condition on (rank, id), order and limit (+1 row to know if there is next page).
+        '''
+        results = ranked.subquery()
+        query = select(results)
+        if self.cursor is not None:
+            key = self.decode_cursor()
+            query = query.where(tuple_(results.c.rank, results.c.id) < tuple_(key['r'], key['id']))
+        return query.order_by(results.c.rank.desc(), results.c.id.desc()).limit(self.limit + 1)
+
+    def page(self, rows, response: Response):
+        rows = list(rows)
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            response.headers['X-Next-Cursor'] = self.encode_cursor(rows[-1])
+        return rows
@@ -0,0 +1,193 @@
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+'''
+Multi process server:  python -m todo serve --workers 4     (from the repository root)
+                  or:  python -m serve --workers 4          (from 'todo' folder)
+
+Parent process imports the app once (preload) and opens the listening socket, then forks the workers. Every worker
+runs uvicorn on the shared socket, so the kernel spreads connections over workers and each worker uses its own core.
+Modules loaded by the parent are shared with workers copy-on-write (gc.freeze() keeps garbage collector from touching,
+and so copying, those objects). Database engine is created in each worker's lifespan, after fork, so no connection is
+ever shared between processes (database.py also resets an inherited engine after fork, just in case).
+
+Database schema is checked (DB_SCHEMA_CHECK, check database.py) once in the parent before fork, a wrong schema stops
+the server before any worker starts.
+
+Workers are recycled gracefully (in-flight requests finish first) and replaced by new ones:
+    --max-requests    after this many requests (+ random jitter so all workers do not restart at the same moment)
+    --max-memory-mb   when resident memory of worker grows over this limit (checked by parent every half second)
+Settings can be given with environment variables as well: WEB_CONCURRENCY, MAX_REQUESTS, MAX_REQUESTS_JITTER,
+MAX_MEMORY_MB, GRACEFUL_TIMEOUT. Fork is needed, so it runs on Linux/macOS only.
+'''
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+MAX_REQUESTS = int(os.getenv('MAX_REQUESTS', '0'))                # 0 - never recycle by request count
+MAX_REQUESTS_JITTER = int(os.getenv('MAX_REQUESTS_JITTER', '0'))
+MAX_MEMORY_MB = int(os.getenv('MAX_MEMORY_MB', '0'))              # 0 - no memory limit
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', '30'))       # seconds a stopping worker gets before it is killed
+BOOT_GRACE = 5                                                    # worker which fails sooner than this after start is a boot error
+
+
+def rss_bytes(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0 # no /proc (macOS), memory limit is not checked there
+
+
+class Supervisor:
+
+    def __init__(self, app, host: str = '127.0.0.1', port: int = 8000, workers: int = WEB_CONCURRENCY,
+                 max_requests: int = MAX_REQUESTS, max_requests_jitter: int = MAX_REQUESTS_JITTER,
+                 max_memory_mb: int = MAX_MEMORY_MB, graceful_timeout: int = GRACEFUL_TIMEOUT, log_level: str = 'info'):
+        self.app = app
+        self.host, self.port = host, port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.children = {}    # pid -> start time
+        self.retiring = set() # pids which were asked to stop because of memory
+        self.stopping = False
+        self.socket = None
+
+    def bind(self):
+        self.socket = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(2048)
+        self.socket.set_inheritable(True)
+
+    def spawn(self):
+        max_requests = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else None
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker(max_requests)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def run_worker(self, max_requests):
+        import uvicorn
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL) # uvicorn sets its own handlers for graceful shutdown
+        config = uvicorn.Config(self.app, lifespan = 'on', log_level = self.log_level, limit_max_requests = max_requests,
+                                timeout_graceful_shutdown = self.graceful_timeout)
+        server = uvicorn.Server(config)
+        server.run(sockets = [self.socket])
+        if not server.started:
+            raise SystemExit(1) # lifespan startup failed (for example database schema is not at the newest revision)
+
+    def reap(self) -> bool:
+        '''
+        Collects exited workers and starts new ones in their place. Returns False if a worker failed while booting,
+        then there is no point to start it again and again.
+        '''
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            started = self.children.pop(pid, time.monotonic())
+            retired = pid in self.retiring
+            self.retiring.discard(pid)
+            if os.waitstatus_to_exitcode(status) != 0 and time.monotonic() - started < BOOT_GRACE and not (self.stopping or retired):
+                print(f'[serve] worker {pid} failed to boot, stopping', file = sys.stderr)
+                return False
+            if not self.stopping:
+                self.spawn()
+        return True
+
+    def check_memory(self):
+        if not self.max_memory:
+            return
+        for pid in list(self.children):
+            if pid not in self.retiring and rss_bytes(pid) > self.max_memory:
+                print(f'[serve] worker {pid} is over {self.max_memory // (1024 * 1024)} MB, recycling', file = sys.stderr)
+                self.retiring.add(pid)
+                os.kill(pid, signal.SIGTERM)
+
+    def stop(self):
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.05)
+            else:
+                self.children.pop(pid, None)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+
+    def run(self) -> int:
+        self.bind()
+        gc.freeze() # everything loaded so far stays shared with workers after fork
+        for _ in range(self.workers):
+            self.spawn()
+
+        def handle_stop(signum, frame):
+            self.stopping = True
+        signal.signal(signal.SIGTERM, handle_stop)
+        signal.signal(signal.SIGINT, handle_stop)
+
+        print(f'[serve] {self.workers} workers on http://{self.host}:{self.port} (parent pid {os.getpid()})', file = sys.stderr)
+        healthy = True
+        while not self.stopping and healthy:
+            healthy = self.reap()
+            self.check_memory()
+            time.sleep(0.5)
+        self.stopping = True
+        self.stop()
+        self.socket.close()
+        return 0 if healthy else 1
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'serve', description = 'Run the todo app on several worker processes')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--workers', type = int, default = WEB_CONCURRENCY)
+    parser.add_argument('--max-requests', type = int, default = MAX_REQUESTS)
+    parser.add_argument('--max-requests-jitter', type = int, default = MAX_REQUESTS_JITTER)
+    parser.add_argument('--max-memory-mb', type = int, default = MAX_MEMORY_MB)
+    parser.add_argument('--graceful-timeout', type = int, default = GRACEFUL_TIMEOUT)
+    parser.add_argument('--log-level', default = 'info')
+    args = parser.parse_args(argv)
+
+    import asyncio
+    from database import SCHEMA_CHECK, init_engine, dispose_engine
+    from main import create_app, prepare_database # preload, imported once in parent and shared by workers
+
+    async def prepare():
+        # schema is checked (or created) once here and not by every worker at the same time,
+        # engine is disposed before fork so no connection is inherited by workers
+        try:
+            await prepare_database(init_engine(), SCHEMA_CHECK)
+        finally:
+            await dispose_engine()
+    asyncio.run(prepare())
+    app = create_app(schema_check = 'off')
+
+    supervisor = Supervisor(app, host = args.host, port = args.port, workers = args.workers,
+                            max_requests = args.max_requests, max_requests_jitter = args.max_requests_jitter,
+                            max_memory_mb = args.max_memory_mb, graceful_timeout = args.graceful_timeout,
+                            log_level = args.log_level)
+    sys.exit(supervisor.run())
+
+
+if __name__ == '__main__':
+    main()
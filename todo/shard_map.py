@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from fastapi import HTTPException
+
+'''
+Shard map for horizontal sharding of todos, used only when SHARD_MAP environment variable is set (path of a json file).
+Without it todos stay in the main database (DATABASE_URL) as before.
+
+Every todo query is scoped by owner_id, so owner_id is the shard key: todos and todo_stats rows of one owner always live
+together in one shard database. Users (and everything else) stay in the main database. Owners are spread over a fixed
+number of buckets (owner_id % number of buckets) and the map says which shard holds each bucket, so resharding moves
+whole buckets from one shard to another without renumbering anything (check sharding.py, 'python -m sharding move').
+
+    {
+        "shards": {"main": "postgresql+asyncpg://.../tododb", "east": "postgresql+asyncpg://.../tododb_east"},
+        "buckets": ["main", "main", "east", "east"],
+        "frozen": []
+    }
+
+A shard with the same url as DATABASE_URL uses the main engine (one connection, one transaction with users).
+'frozen' buckets are being moved, their owners can read but every write answers 503 until the move is done.
+Every worker re-reads the file when it changes (checked at most every SHARD_MAP_RELOAD seconds), so a move done by the
+tool reaches all workers without restart.
+'''
+
+SHARD_MAP = os.getenv('SHARD_MAP')                                   # path of the map file, not set - no sharding
+SHARD_MAP_RELOAD = float(os.getenv('SHARD_MAP_RELOAD', '2'))         # seconds
+SHARDED_TABLES = ('todos', 'todo_stats')                             # tables which are split by owner_id
+
+
+class ShardMap:
+
+    def __init__(self, shards: dict, buckets: list, frozen = ()):
+        if not buckets:
+            raise ValueError('shard map needs at least one bucket')
+        unknown = set(buckets) - set(shards)
+        if unknown:
+            raise ValueError(f'buckets refer to unknown shards: {sorted(unknown)}')
+        self.shards = dict(shards)
+        self.buckets = list(buckets)
+        self.frozen = set(frozen)
+
+    @classmethod
+    def load(cls, path: str) -> 'ShardMap':
+        with open(path) as file:
+            data = json.load(file)
+        return cls(data['shards'], data['buckets'], data.get('frozen', ()))
+
+    def save(self, path: str):
+        # written to a temporary file and renamed, so a worker never reads half written map
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'shards': self.shards, 'buckets': self.buckets, 'frozen': sorted(self.frozen)}, file, indent = 4)
+        os.replace(temporary, path)
+
+    def bucket(self, owner_id: int) -> int:
+        return owner_id % len(self.buckets)
+
+    def shard_for(self, owner_id: int) -> str:
+        return self.buckets[self.bucket(owner_id)]
+
+    def is_frozen(self, owner_id: int) -> bool:
+        return self.bucket(owner_id) in self.frozen
+
+
+class ShardSet:
+    '''
+    Shard map of this process and one engine per shard, engines are made by the factory given to configure()
+    (database.init_engine passes its own, so shards get the same pool settings as the main engine).
+    '''
+
+    def __init__(self):
+        self.path = None
+        self.map = None
+        self.engines = {}        # shard name -> engine
+        self.owned = []          # engines created here (not the main engine), disposed by dispose()
+        self._create_engine = None
+        self._main_url = None
+        self._main_engine = None
+        self._mtime = None
+        self._checked = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.map is not None
+
+    def configure(self, path: str, create_engine, main_url: str = None, main_engine = None):
+        self.path = path
+        self._create_engine = create_engine
+        self._main_url, self._main_engine = main_url, main_engine
+        self.map, self._mtime = None, None
+        if path:
+            self.reload()
+
+    def reload(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self.map, self._mtime = ShardMap.load(self.path), mtime
+            for name, url in self.map.shards.items():
+                if name not in self.engines:
+                    if url == self._main_url:
+                        self.engines[name] = self._main_engine
+                    else:
+                        self.engines[name] = self._create_engine(url)
+                        self.owned.append(self.engines[name])
+        self._checked = time.monotonic()
+
+    def current(self) -> ShardMap:
+        if self.enabled and time.monotonic() - self._checked >= SHARD_MAP_RELOAD:
+            self.reload()
+        return self.map
+
+    def names(self) -> list:
+        '''
+        Names of all shards, [None] without sharding, so callers can always loop over shards.
+        '''
+        return list(self.current().shards) if self.enabled else [None]
+
+    def engine(self, name: str):
+        return self.engines[name]
+
+    def shard_for(self, owner_id: int):
+        return self.current().shard_for(owner_id) if self.enabled else None
+
+    def route(self, db, owner_id: int, write: bool = False):
+        '''
+        Sends todos / todo_stats statements of this session to the owner's shard (check RoutingSession in database.py).
+        Writes of an owner whose bucket is being moved are refused, client should try again a bit later.
+        '''
+        if not self.enabled or owner_id is None:
+            return db
+        shard_map = self.current()
+        if write and shard_map.is_frozen(owner_id):
+            raise HTTPException(status_code = 503, detail = 'Todos Are Being Moved, Try Again',
+                                headers = {'Retry-After': str(int(SHARD_MAP_RELOAD) + 1)})
+        db.info['shard'] = shard_map.shard_for(owner_id)
+        return db
+
+    async def dispose(self):
+        for engine in self.owned:
+            await engine.dispose()
+        self.engines, self.owned = {}, []
+        self.map = None
+
+
+shards = ShardSet()
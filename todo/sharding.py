@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import os
+import sys
+from sqlalchemy import case, delete, func, inspect, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import IdCounters, Todos, TodoStats, TODO_SEARCH_DDL, TODO_STATS_DDL
+from shard_map import SHARD_MAP, SHARD_MAP_RELOAD, ShardMap, shards
+import sqlite_profile
+
+'''
+Horizontal sharding of todos by owner_id, the shard map and routing of sessions are in shard_map.py, here are the parts
+which need the models:
+    scatter()          - runs one select on every shard at the same time and returns all rows (admin lists, global stats)
+    assign_todo_ids()  - ids of new todos come from id_counters in the main database, so they are unique over all shards
+    create_shard_schema() - todos and todo_stats tables (with indexes, search index and stats trigger) in a shard database
+
+Command line (from 'todo' folder, SHARD_MAP environment variable or --map points to the map file):
+    python -m sharding init                 - creates tables in every shard which does not have them yet
+    python -m sharding status               - buckets and number of todos of every shard
+    python -m sharding move BUCKET SHARD    - moves one bucket (all its owners' todos and stats) to another shard
+Resharding is adding a new shard to the map, 'init', then moving buckets to it one by one. A move:
+    1. bucket is frozen in the map, workers refuse writes of its owners (503) once they re-read the map
+    2. todos and todo_stats of the bucket are copied to the new shard (in one transaction there)
+    3. map points the bucket to the new shard (still frozen), then the bucket is unfrozen
+    4. rows are deleted from the old shard (every worker reads the bucket from the new shard already)
+Tool waits after steps 1 and 3 (--wait, default a bit more than two SHARD_MAP_RELOAD periods), so every worker has seen
+the previous step before the next one starts. Reads keep working during the whole move.
+
+Shard databases have no users table, so todos.owner_id there has no foreign key. Alembic migrates only the main database,
+a migration which changes todos or todo_stats has to be run on every shard as well.
+'''
+
+SHARDED_MODELS = (Todos, TodoStats)
+ID_BLOCK_SIZE = int(os.getenv('TODO_ID_BLOCK_SIZE', '100'))    # ids reserved from main database at once, per worker
+MOVE_WAIT = 2 * SHARD_MAP_RELOAD + 1                           # seconds
+MOVE_BATCH_SIZE = 1000
+
+
+async def scatter(db, statement) -> list:
+    '''
+    Rows of statement from all shards together (order between shards is not kept, merge them if it matters).
+    Without sharding it simply runs on db.
+    '''
+    if not shards.enabled:
+        return (await db.execute(statement)).all()
+
+    async def run(engine):
+        async with sqlite_profile.read_only_engine(engine).connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    results = await asyncio.gather(*(run(shards.engine(name)) for name in shards.names()))
+    return [row for rows in results for row in rows]
+
+
+async def highest_id(model) -> int:
+    return max([row[0] or 0 for row in await scatter(None, select(func.max(model.id)))] or [0])
+
+
+class IdAllocator:
+    '''
+    Hands out ids of one sharded table. A block of ids is reserved in id_counters (one short transaction on the main
+    database) and used up in this worker, so most inserts do not touch the main database at all.
+    '''
+
+    def __init__(self, model, block_size: int = ID_BLOCK_SIZE):
+        self.model = model
+        self.name = model.__tablename__
+        self.block_size = block_size
+        self.lock = asyncio.Lock()
+        self.reset()
+
+    def reset(self):
+        self.next = self.end = 0
+
+    async def reserve(self, size: int) -> int:
+        '''
+        Returns first id of a new block of 'size' ids. Counter never goes below the highest existing id, so todos made
+        before sharding was switched on (with the database's own sequence) are never given out twice.
+        '''
+        import database
+        floor = await highest_id(self.model) + 1
+        while True:
+            async with database.engine.begin() as connection:
+                end = (await connection.execute(update(IdCounters).where(IdCounters.name == self.name)
+                                                .values(next_id = case((IdCounters.next_id > floor, IdCounters.next_id), else_ = floor) + size)
+                                                .returning(IdCounters.next_id))).scalar()
+                if end is not None:
+                    return end - size
+            try:
+                async with database.engine.begin() as connection:
+                    await connection.execute(insert(IdCounters).values(name = self.name, next_id = floor + size))
+                return floor
+            except IntegrityError:
+                pass # other worker created the counter at the same moment, take a block from it
+
+    async def allocate(self, count: int) -> list:
+        async with self.lock:
+            ids = []
+            while len(ids) < count:
+                if self.next >= self.end:
+                    size = max(self.block_size, count - len(ids))
+                    self.next = await self.reserve(size)
+                    self.end = self.next + size
+                taken = min(count - len(ids), self.end - self.next)
+                ids.extend(range(self.next, self.next + taken))
+                self.next += taken
+            return ids
+
+
+todo_ids = IdAllocator(Todos)
+os.register_at_fork(after_in_child = todo_ids.reset) # a block reserved by parent must not be used by two workers
+
+
+async def assign_todo_ids(todos: list):
+    '''
+    With sharding, sets ids of new todos (Todos objects or row dicts) before insert. Without sharding database gives ids.
+    '''
+    if not shards.enabled:
+        return
+    for todo, todo_id in zip(todos, await todo_ids.allocate(len(todos))):
+        if isinstance(todo, dict):
+            todo['id'] = todo_id
+        else:
+            todo.id = todo_id
+
+
+def create_sharded_tables(connection):
+    existing = set(inspect(connection).get_table_names())
+    for model in SHARDED_MODELS:
+        table = model.__table__
+        if table.name not in existing:
+            connection.execute(CreateTable(table, include_foreign_key_constraints = [])) # users are not in shards
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+    for statement in TODO_SEARCH_DDL.get(connection.dialect.name, []) + TODO_STATS_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+async def create_shard_schema(engine):
+    async with engine.begin() as connection:
+        await connection.run_sync(create_sharded_tables)
+
+
+async def create_shard_schemas(main_engine):
+    '''
+    Tables in every shard except the main database (it has the full schema already).
+    '''
+    for name in shards.names():
+        if shards.engine(name) is not main_engine:
+            await create_shard_schema(shards.engine(name))
+
+
+def in_bucket(model, shard_map: ShardMap, bucket: int):
+    return model.owner_id % len(shard_map.buckets) == bucket
+
+
+async def copy_bucket(source, target, shard_map: ShardMap, bucket: int, batch_size: int = MOVE_BATCH_SIZE) -> int:
+    '''
+    Copies todos and todo_stats of the bucket from source to target engine in one target transaction.
+    Rows left in target by an earlier failed move are deleted first, so a move can always be run again.
+    '''
+    copied = 0
+    async with sqlite_profile.read_only_engine(source).connect() as reader, target.begin() as writer:
+        for model in SHARDED_MODELS:
+            table = model.__table__
+            await writer.execute(delete(table).where(in_bucket(model, shard_map, bucket)))
+            key = table.primary_key.columns[0]
+            last = None
+            while True:
+                query = select(table).where(in_bucket(model, shard_map, bucket)).order_by(key).limit(batch_size)
+                if last is not None:
+                    query = query.where(key > last)
+                rows = [row._asdict() for row in (await reader.execute(query)).all()]
+                if not rows:
+                    break
+                await writer.execute(insert(table), rows)
+                last = rows[-1][key.name]
+                if model is Todos:
+                    copied += len(rows)
+    return copied
+
+
+async def delete_bucket(engine, shard_map: ShardMap, bucket: int):
+    async with engine.begin() as connection:
+        for model in SHARDED_MODELS:
+            await connection.execute(delete(model.__table__).where(in_bucket(model, shard_map, bucket)))
+
+
+async def move_bucket(path: str, bucket: int, target: str, wait: float = MOVE_WAIT, log = print) -> int:
+    '''
+    Moves one bucket to target shard, steps are described at the top of this file. Returns number of todos moved.
+    Needs configured shards (init_engine) for the same map file.
+    '''
+    shard_map = ShardMap.load(path)
+    if not 0 <= bucket < len(shard_map.buckets):
+        raise ValueError(f'bucket must be between 0 and {len(shard_map.buckets) - 1}')
+    if target not in shard_map.shards:
+        raise ValueError(f'unknown shard {target!r}')
+    source = shard_map.buckets[bucket]
+    if source == target:
+        log(f'bucket {bucket} is already in {target}')
+        return 0
+    shards.reload()
+
+    log(f'freezing bucket {bucket}')
+    shard_map.frozen.add(bucket)
+    shard_map.save(path)
+    await asyncio.sleep(wait)
+    try:
+        log(f'copying bucket {bucket} from {source} to {target}')
+        moved = await copy_bucket(shards.engine(source), shards.engine(target), shard_map, bucket)
+    except BaseException:
+        shard_map.frozen.discard(bucket)
+        shard_map.save(path)
+        raise
+
+    shard_map.buckets[bucket] = target
+    shard_map.save(path)
+    await asyncio.sleep(wait)
+    shard_map.frozen.discard(bucket)
+    shard_map.save(path)
+
+    log(f'deleting bucket {bucket} from {source}')
+    await delete_bucket(shards.engine(source), shard_map, bucket)
+    log(f'moved {moved} todos of bucket {bucket} to {target}')
+    return moved
+
+
+async def shard_status() -> dict:
+    shard_map = shards.current()
+    status = {}
+    for name in shard_map.shards:
+        async with sqlite_profile.read_only_engine(shards.engine(name)).connect() as connection:
+            todos = (await connection.execute(select(func.count()).select_from(Todos.__table__))).scalar()
+        status[name] = {'buckets': [bucket for bucket, shard in enumerate(shard_map.buckets) if shard == name], 'todos': todos}
+    return status
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'sharding', description = 'Todo shards maintenance')
+    parser.add_argument('--map', default = SHARD_MAP, help = 'shard map file (default SHARD_MAP environment variable)')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    commands.add_parser('init')
+    commands.add_parser('status')
+    move = commands.add_parser('move')
+    move.add_argument('bucket', type = int)
+    move.add_argument('shard')
+    move.add_argument('--wait', type = float, default = MOVE_WAIT)
+    args = parser.parse_args(argv)
+    if not args.map:
+        parser.error('shard map file is needed, set SHARD_MAP or use --map')
+
+    from database import init_engine, dispose_engine
+
+    async def run():
+        main_engine = init_engine(shard_map = args.map)
+        try:
+            if args.command == 'init':
+                await create_shard_schemas(main_engine)
+                print(f'tables are ready in shards: {", ".join(shards.names())}')
+            elif args.command == 'status':
+                for name, status in (await shard_status()).items():
+                    print(f'{name}: {status["todos"]} todos, buckets {status["buckets"]}')
+            else:
+                await move_bucket(args.map, args.bucket, args.shard, args.wait)
+        finally:
+            await dispose_engine()
+
+    try:
+        asyncio.run(run())
+    except ValueError as error:
+        print(error, file = sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
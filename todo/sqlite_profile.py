@@ -0,0 +1,156 @@
+import asyncio
+import os
+import sqlite3
+import weakref
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only
+
+'''
+Sqlite settings for small installs where the app and its database file are on the same machine
+(DATABASE_URL=sqlite+aiosqlite:///./todosapp.db). Selected with DB_SQLITE_PROFILE environment variable:
+    default     - driver defaults, like before (rollback journal, every commit waits for fsync, deferred BEGIN)
+    production  - settings below, only sqlite engines are changed, postgres urls ignore the profile
+
+Every new connection gets (engine 'connect' event):
+    journal_mode=WAL      - readers do not block the writer and the writer does not block readers (kept in the file)
+    synchronous=NORMAL    - with WAL a commit does not wait for fsync, only checkpoints do, a power loss can lose the last
+                            commits but never corrupts the database
+    mmap_size             - pages are read from memory mapped file instead of read() calls (SQLITE_MMAP_SIZE bytes)
+    cache_size            - page cache of every connection (SQLITE_CACHE_SIZE_KB)
+    busy_timeout          - how long a writer waits for the write lock of another process before 'database is locked'
+and the driver keeps SQLITE_STATEMENT_CACHE prepared statements per connection (sqlite3 'cached_statements'), so repeated
+queries are not parsed again.
+
+Writers: sqlite has one writer at a time. Driver starts transactions with a deferred BEGIN, so a transaction which reads
+first and writes later (most of ours, e.g. stats) asks for the write lock in the middle and fails at once with
+'database is locked' when another writer committed since its read, busy timeout does not help there. So in this profile
+SQLAlchemy starts transactions itself ('begin' event):
+    read-only sessions (GET requests, check deferred_reads())  - BEGIN, they never wait for writers
+    everything else                                            - BEGIN IMMEDIATE, write lock is taken at the start
+Inside one worker write transactions of an engine also wait on an asyncio lock, in order, instead of many threads polling
+in sqlite's busy handler. busy_timeout is left for writers of other worker processes. Check benchmarks/bench_sqlite_profile.py.
+The lock belongs to the task (request) which took it, so a second connection opened by the same task (e.g. id block
+reservation in sharding.py during a write session) does not wait for its own lock. Sqlite still has one writer per file,
+so that connection can write only while the first one has no write transaction open (assign_todo_ids runs before the
+first statement of the session). Connections which only read (sharding.scatter, health checks, schema check) are opened
+with read_only_engine(), they begin DEFERRED and never take the lock.
+'''
+
+SQLITE_PROFILE = os.getenv('DB_SQLITE_PROFILE', 'default')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+
+PROFILES = ('default', 'production')
+
+# sync engine -> same engine (same pool) whose transactions begin DEFERRED, only for engines with the profile
+_readers = weakref.WeakKeyDictionary()
+
+
+class WriteLock:
+    '''
+    asyncio lock of one engine's write transactions, re-entrant for the task which holds it: every connection of that
+    task takes it once more and releases it when it goes back to pool.
+    '''
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.owner = None
+        self.count = 0
+
+    async def acquire(self, task):
+        if self.owner is not task:
+            await self._lock.acquire()
+            self.owner = task
+        self.count += 1
+
+    def release(self):
+        self.count -= 1
+        if self.count == 0:
+            self.owner = None
+            self._lock.release()
+
+
+def uses_profile(url: str, profile: str = None) -> bool:
+    profile = profile or SQLITE_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f'DB_SQLITE_PROFILE must be one of {", ".join(PROFILES)}, not {profile!r}')
+    return profile == 'production' and make_url(url).get_backend_name() == 'sqlite'
+
+
+def connect_args(url: str, profile: str = None) -> dict:
+    '''
+    Extra create_async_engine() arguments, statement cache can only be given when connection is opened.
+    '''
+    return {'connect_args': {'cached_statements': SQLITE_STATEMENT_CACHE}} if uses_profile(url, profile) else {}
+
+
+def apply(engine, profile: str = None):
+    '''
+    Adds the pragmas and transaction handling of the production profile to a new engine, nothing for other engines.
+    '''
+    if not uses_profile(str(engine.url), profile):
+        return engine
+    sync_engine = engine.sync_engine
+    write_lock = WriteLock()
+
+    @event.listens_for(sync_engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None # driver does not BEGIN by itself anymore, begin_transaction() does
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}') # negative - size in KiB, not in pages
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        cursor.close()
+
+    @event.listens_for(sync_engine, 'begin')
+    def begin_transaction(connection):
+        if connection.get_execution_options().get('sqlite_begin') == 'DEFERRED':
+            connection.exec_driver_sql('BEGIN')
+            return
+        # lock is kept until the connection goes back to pool (after commit / rollback), a connection which
+        # starts its next transaction before that already has it
+        if connection.info.get('write_lock') is None:
+            try:
+                # task is looked up here, wait_for runs acquire() in a task of its own
+                await_only(asyncio.wait_for(write_lock.acquire(asyncio.current_task()), SQLITE_BUSY_TIMEOUT_MS / 1000))
+            except asyncio.TimeoutError:
+                raise exc.OperationalError('BEGIN IMMEDIATE', None, sqlite3.OperationalError('database is locked')) from None
+            connection.info['write_lock'] = write_lock
+        try:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+        except BaseException:
+            release_write_lock(connection.info)
+            raise
+
+    @event.listens_for(sync_engine, 'checkin')
+    def release_on_checkin(dbapi_connection, connection_record):
+        release_write_lock(connection_record.info)
+
+    _readers[sync_engine] = sync_engine.execution_options(sqlite_begin = 'DEFERRED')
+    return engine
+
+
+def release_write_lock(info: dict):
+    lock = info.pop('write_lock', None)
+    if lock is not None:
+        lock.release()
+
+
+def read_only_engine(engine):
+    '''
+    Async engine for connections which never write: same engine (and pool) whose transactions begin DEFERRED when it has
+    the production profile, so they do not take the write lock. Other engines are returned as they are.
+    '''
+    return engine.execution_options(sqlite_begin = 'DEFERRED') if engine.sync_engine in _readers else engine
+
+
+def deferred_reads(bind):
+    '''
+    Bind for a read-only session: same engine whose transactions begin DEFERRED when it has the production profile.
+    '''
+    return _readers.get(bind, bind)
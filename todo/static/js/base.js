@@ -122,6 +122,109 @@
         
     }
 
+    // Live Todo List JS
+    // todo page listens to /todos/events (server-sent events) and patches the table in place when a todo is created,
+    // changed or deleted (also from other tabs and devices), instead of reloading the page. fetch is used instead of
+    // EventSource because the endpoint needs the Authorization header.
+    const todoList = document.getElementById('todoList');
+    if (todoList) {
+        listenForTodoChanges(todoList);
+    }
+
+    async function listenForTodoChanges(todoList) {
+        const token = getCookie('access_token');
+        if (!token) {
+            return;
+        }
+        while (true) {
+            try {
+                const response = await fetch('/todos/events', {
+                    headers: { 'Authorization': `Bearer ${token}` }
+                });
+                if (response.status === 401) {
+                    return;
+                }
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) {
+                        break;
+                    }
+                    buffer += value;
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) >= 0) {
+                        applyTodoEvent(todoList, buffer.substring(0, end));
+                        buffer = buffer.substring(end + 2);
+                    }
+                }
+            } catch (error) {
+                console.error('Todo events:', error);
+            }
+            await new Promise(resolve => setTimeout(resolve, 3000)); // reconnect
+        }
+    }
+
+    function applyTodoEvent(todoList, message) {
+        let type = null;
+        let data = '';
+        for (const line of message.split('\n')) {
+            if (line.startsWith('event: ')) {
+                type = line.substring(7);
+            } else if (line.startsWith('data: ')) {
+                data += line.substring(6);
+            }
+        }
+        if (type === null) {
+            return; // heartbeat or retry line
+        }
+        if (type === 'resync') {
+            window.location.reload(); // events were missed, render the list again
+            return;
+        }
+        for (const todo of JSON.parse(data)) {
+            const row = todoList.querySelector(`tr[data-todo-id="${todo.id}"]`);
+            if (type === 'deleted') {
+                if (row) {
+                    row.remove();
+                }
+            } else if (row) {
+                row.replaceWith(todoRow(todo));
+            } else {
+                todoList.appendChild(todoRow(todo));
+            }
+        }
+        const rows = todoList.querySelectorAll('tr');
+        rows.forEach((row, index) => row.cells[0].textContent = index + 1);
+        const todoCount = document.getElementById('todoCount');
+        if (todoCount) {
+            const completed = todoList.querySelectorAll('tr.alert-success').length;
+            todoCount.textContent = `${completed} of ${rows.length} completed`;
+        }
+    }
+
+    // same markup as the rows in todo.html
+    function todoRow(todo) {
+        const row = document.createElement('tr');
+        row.className = todo.complete ? 'pointer alert alert-success' : 'pointer';
+        row.dataset.todoId = todo.id;
+        const number = document.createElement('td');
+        const title = document.createElement('td');
+        title.textContent = todo.title;
+        if (todo.complete) {
+            title.className = 'strike-through-td';
+        }
+        const actions = document.createElement('td');
+        const editButton = document.createElement('button');
+        editButton.type = 'button';
+        editButton.className = 'btn btn-info';
+        editButton.textContent = 'Edit';
+        editButton.onclick = () => window.location.href = `edit-todo-page/${todo.id}`;
+        actions.appendChild(editButton);
+        row.append(number, title, actions);
+        return row;
+    }
+
     // Login JS
     const loginForm = document.getElementById('loginForm');
     if (loginForm) {
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import Todos, TodoStats
+from sharding import scatter
+from shard_map import shards
+
+'''
+Todo statistics (total, completed, count per priority) per user and for all users.
+Counters live in todo_stats table, one row per user. Every endpoint which creates or deletes todos calls change_stats()
+before db.commit(), updates of complete/priority are counted by a database trigger (TODO_STATS_DDL in models.py), so
+counters change in the same transaction as todos and are never half updated.
+Reading stats of one user is one primary key lookup, global stats sum todo_stats rows (one per user), todos is never scanned.
+Global numbers are not kept in one extra row on purpose, every write of every user would wait for the lock on that row.
+With sharding (check sharding.py) todo_stats rows live in the shard of their owner, global stats are summed over shards.
+
+If counters ever drift (todos changed by hand in database, old data), recount them from todos:
+    python -m stats rebuild          (run from 'todo' folder)
+or POST /admin/stats/rebuild.
+'''
+
+PRIORITIES = range(1, 6)
+COUNTERS = ('total', 'completed') + tuple(f'priority_{priority}' for priority in PRIORITIES)
+
+
+def todo_delta(todos, sign: int = 1) -> dict:
+    '''
+    Counter changes for todos (anything with 'complete' and 'priority') which were added (sign 1) or removed (sign -1).
+    '''
+    delta = dict.fromkeys(COUNTERS, 0)
+    for todo in todos:
+        delta['total'] += sign
+        delta['completed'] += sign * bool(todo.complete)
+        if f'priority_{todo.priority}' in delta:
+            delta[f'priority_{todo.priority}'] += sign
+    return delta
+
+
+async def change_stats(db, owner_id, delta: dict):
+    '''
+    Adds delta to owner's counters, row is created if owner has none yet. One INSERT ... ON CONFLICT DO UPDATE statement,
+    must run in the same transaction as the todo change (before db.commit()).
+    '''
+    if not any(delta.values()):
+        return
+    dialect = postgresql if db.get_bind(TodoStats).dialect.name == 'postgresql' else sqlite
+    query = dialect.insert(TodoStats).values(owner_id = owner_id, **delta)
+    await db.execute(query.on_conflict_do_update(
+        index_elements = [TodoStats.owner_id],
+        set_ = {counter: getattr(TodoStats, counter) + getattr(query.excluded, counter) for counter in COUNTERS}))
+
+
+def as_dict(row) -> dict:
+    values = row if isinstance(row, dict) else row._asdict() if row is not None else {}
+    return {'total': values.get('total') or 0, 'completed': values.get('completed') or 0,
+            'by_priority': {str(priority): values.get(f'priority_{priority}') or 0 for priority in PRIORITIES}}
+
+
+async def owner_stats(db, owner_id) -> dict:
+    counters = [getattr(TodoStats, counter) for counter in COUNTERS]
+    return as_dict((await db.execute(select(*counters).where(TodoStats.owner_id == owner_id))).first())
+
+
+async def global_stats(db) -> dict:
+    sums = [func.sum(getattr(TodoStats, counter)).label(counter) for counter in COUNTERS]
+    rows = await scatter(db, select(*sums, func.count().label('users')))
+    totals = {counter: sum(getattr(row, counter) or 0 for row in rows) for counter in COUNTERS + ('users',)}
+    return {**as_dict(totals), 'users': totals['users']}
+
+
+async def rebuild_stats(db) -> int:
+    '''
+    Recounts all counters from todos in one transaction (one per shard), returns number of owners. Full scan of todos,
+    so it is an admin/maintenance operation only.
+    '''
+    counts = [func.count().label('total'), func.sum(case((Todos.complete == True, 1), else_ = 0)).label('completed')]
+    counts += [func.sum(case((Todos.priority == priority, 1), else_ = 0)).label(f'priority_{priority}') for priority in PRIORITIES]
+    owners = 0
+    for shard in shards.names():
+        bind_arguments = {'shard': shard}
+        await db.execute(delete(TodoStats), bind_arguments = bind_arguments)
+        await db.execute(insert(TodoStats).from_select(['owner_id', *COUNTERS],
+                                                       select(Todos.owner_id, *counts).where(Todos.owner_id.is_not(None))
+                                                       .group_by(Todos.owner_id)), bind_arguments = bind_arguments)
+        owners += (await db.execute(select(func.count()).select_from(TodoStats), bind_arguments = bind_arguments)).scalar()
+    await db.commit()
+    return owners
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Todo statistics maintenance')
+    parser.add_argument('command', choices = ['rebuild'])
+    parser.parse_args()
+
+    from database import SessionLocal, init_engine, dispose_engine
+
+    async def rebuild():
+        init_engine()
+        async with SessionLocal() as db:
+            owners = await rebuild_stats(db)
+        await dispose_engine()
+        print(f'todo stats rebuilt for {owners} users')
+
+    asyncio.run(rebuild())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 from test.utils import * 
-from routers.admin import get_db, get_current_user
+from routers.admin import get_db, get_sessionmaker, get_current_user
 from fastapi import status
+import json
 
 app.dependency_overrides[get_db] = override_get_db
 app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[get_sessionmaker] = lambda: TestingAsyncSessionLocal
 
 def test_admin_read_all_authenticated(test_todo):
     response = client.get("/admin/todo")
@@ -14,7 +16,8 @@ def test_admin_read_all_authenticated(test_todo):
         "priority": 5,
         "complete": True,
         "owner_id": 1,
-        "id": 1
+        "id": 1,
+        "version": 1
     }]
 
 def test_delete_todos(test_todo):
@@ -33,4 +36,52 @@ def test_admin_delete_todo_not_found():
     assert response.status_code == 404
     assert response.json() == {"detail": "Todo Not Found"}
 
+def test_admin_pool_stats(app_engine):
+    response = client.get("/admin/pool")
 
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["checked_out"] == 0
+    assert "max_wait_ms" in response.json()
+
+def test_admin_read_all_page_size_is_bounded():
+    response = client.get("/admin/todo", params = {"limit": 10000})
+    assert response.status_code == 422
+
+def test_admin_export_ndjson(test_todo):
+    response = client.get("/admin/todo/export")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [{
+        "id": 1,
+        "title": "Learn To Code",
+        "description": "Learn To Code Everyday",
+        "priority": 5,
+        "complete": True,
+        "owner_id": 1
+    }]
+
+def test_admin_export_csv(test_todo):
+    response = client.get("/admin/todo/export", params = {"format": "csv"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == [
+        "id,title,description,priority,complete,owner_id",
+        "1,Learn To Code,Learn To Code Everyday,5,True,1"
+    ]
+
+def test_admin_stats_rebuild(test_todo):
+    # test_todo fixture inserts directly in database, so counters are missing until they are rebuilt
+    assert client.get("/admin/stats").json()["total"] == 0
+
+    response = client.post("/admin/stats/rebuild")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"users": 1}
+
+    expected = {"total": 1, "completed": 1, "by_priority": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1}}
+    assert client.get("/admin/stats").json() == {**expected, "users": 1}
+    assert client.get("/admin/stats", params = {"owner_id": 1}).json() == expected
+
+    client.delete("/admin/todo/1")
+    assert client.get("/admin/stats", params = {"owner_id": 1}).json()["total"] == 0
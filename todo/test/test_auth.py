@@ -4,26 +4,30 @@ from jose import jwt
 from datetime import timedelta
 import pytest
 from fastapi import HTTPException
+from token_cache import TokenCache, token_cache
 
 app.dependency_overrides[get_db] = override_get_db
 
 
-def test_authenticate_user(test_user):
-    db = TestingSessionLocal()
+@pytest.mark.asyncio
+async def test_authenticate_user(test_user):
+    db = TestingAsyncSessionLocal()
 
-    authenticated_user = authenticate_user(test_user.username, "testpassword", db)
+    authenticated_user = await authenticate_user(test_user.username, "testpassword", db)
 
     assert authenticated_user is not None
     assert authenticated_user.username == test_user.username
 
     # test with a nonexisting user(user who is not existing in db)
-    non_existing_user = authenticate_user("wrong_username", "testpassword", db)
+    non_existing_user = await authenticate_user("wrong_username", "testpassword", db)
     assert non_existing_user is False
 
     # test to validate a user who is loging in with a wrong password
-    wrong_password_user = authenticate_user(test_user.username, "wronpassword", db)
+    wrong_password_user = await authenticate_user(test_user.username, "wronpassword", db)
     assert wrong_password_user is False
 
+    await db.close()
+
 def test_create_secret_access_token_success():
     username = "testuser"
     user_id = 1
@@ -63,3 +67,39 @@ async def test_get_current_user_missing_payload():
 
     assert excinfo.value.status_code == 401
     assert excinfo.value.detail == 'Could Not Validate User.'
+
+@pytest.mark.asyncio
+async def test_get_current_user_uses_token_cache():
+    token = create_access_token('cacheduser', 7, 'user', timedelta(minutes = 5))
+    token_cache.clear()
+    misses, hits = token_cache.misses, token_cache.hits
+
+    first = await get_current_user(token)
+    second = await get_current_user(token)
+
+    assert first == second == {'username': 'cacheduser', 'id': 7, 'user_role': 'user'}
+    assert token_cache.misses == misses + 1
+    assert token_cache.hits == hits + 1
+
+    # cached user is a copy, changing returned dict should not change the cache
+    second['user_role'] = 'admin'
+    assert (await get_current_user(token))['user_role'] == 'user'
+
+    assert token_cache.revoke_user(7) == 1
+    assert token_cache.get(token) is None
+
+def test_token_cache_expiry_and_eviction():
+    cache = TokenCache(max_size = 2, ttl = 60)
+
+    cache.put('expired', {'id': 1}, exp = 0)
+    assert cache.get('expired') is None
+
+    cache.put('first', {'id': 1})
+    cache.put('second', {'id': 2})
+    cache.get('first') # 'first' is now most recently used, so 'second' is evicted below
+    cache.put('third', {'id': 3})
+
+    assert cache.get('second') is None
+    assert cache.get('first') == {'id': 1}
+    assert cache.revoke('third') is True
+    assert cache.stats()['size'] == 1
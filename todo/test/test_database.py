@@ -0,0 +1,27 @@
+from test.utils import *
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.requests import Request
+import database
+import pytest
+
+'''
+get_db should not take a connection from pool when request never queries, and it should give connection back
+to pool as soon as request is finished.
+'''
+@pytest.mark.asyncio
+async def test_get_db_takes_connection_only_on_first_query(monkeypatch):
+    test_engine = create_async_engine("sqlite+aiosqlite:///./testdb.db", poolclass = database.TimedQueuePool)
+    monkeypatch.setattr(database, "SessionLocal", async_sessionmaker(bind = test_engine))
+
+    dependency = database.get_db(Request({'type': 'http', 'method': 'GET', 'headers': []}))
+    db = await dependency.__anext__()
+    assert test_engine.pool.checkedout() == 0
+
+    await db.execute(text("SELECT 1"))
+    assert test_engine.pool.checkedout() == 1
+
+    await dependency.aclose()
+    assert test_engine.pool.checkedout() == 0
+    assert test_engine.pool.checkouts == 1
+
+    await test_engine.dispose()
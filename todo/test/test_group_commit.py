@@ -0,0 +1,66 @@
+from test.utils import *
+from database import get_db, get_sessionmaker
+from routers.auth import get_current_user
+from routers.todos import TodoRequest
+from group_commit import GroupCommitter
+import routers.todos
+import asyncio
+import httpx
+import pytest
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[get_sessionmaker] = lambda: TestingAsyncSessionLocal
+
+TODO = {'title': 'Group Todo', 'description': 'Written with others', 'priority': 2, 'complete': False}
+
+@pytest.fixture
+def committer(monkeypatch):
+    committer = GroupCommitter(window_ms = 50, max_items = 3)
+    monkeypatch.setattr(routers.todos, 'group_commits', committer)
+    yield committer
+    with engine.connect() as connection:
+        connection.execute(text("DELETE from todos"))
+        connection.execute(text("DELETE from todo_stats"))
+        connection.commit()
+
+# requests run at the same time (one event loop), so they land in the same batches
+@pytest.mark.asyncio
+async def test_concurrent_creates_are_committed_together(committer):
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app), base_url = "http://test") as api:
+        responses = await asyncio.gather(*(api.post("/todos/todo", json = {**TODO, 'title': f'Group Todo {n}'}) for n in range(5)))
+
+    assert [response.status_code for response in responses] == [201] * 5
+    assert (committer.batches, committer.items) == (2, 5) # 3 because of max_items, 2 after the window
+
+    db = TestingSessionLocal()
+    assert sorted(todo.title for todo in db.query(Todos).all()) == [f'Group Todo {n}' for n in range(5)]
+    assert db.execute(text("SELECT total FROM todo_stats WHERE owner_id = 1")).scalar() == 5
+    db.close()
+
+@pytest.mark.asyncio
+async def test_failed_batch_fails_every_request():
+    committer = GroupCommitter(window_ms = 10, max_items = 10)
+
+    def broken_session_factory():
+        raise RuntimeError('database is down')
+
+    results = await asyncio.gather(*(committer.submit(broken_session_factory, 1, TodoRequest(**TODO)) for _ in range(2)),
+                                   return_exceptions = True)
+
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert committer.batches == 0
+
+@pytest.mark.asyncio
+async def test_batch_is_written_with_session_factory_of_its_requests():
+    committer = GroupCommitter(window_ms = 10, max_items = 10)
+
+    def session_factory(name):
+        def broken_session_factory():
+            raise RuntimeError(name)
+        return broken_session_factory
+
+    results = await asyncio.gather(*(committer.submit(session_factory(name), 1, TodoRequest(**TODO)) for name in ('first', 'second')),
+                                   return_exceptions = True)
+
+    assert [str(result) for result in results] == ['first', 'second']
@@ -0,0 +1,34 @@
+from hashing import HashingExecutor, bcrypt_context
+from fastapi import HTTPException
+import asyncio
+import pytest
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_in_process_pool():
+    executor = HashingExecutor(workers = 1, max_pending = 2)
+
+    hashed_password = await executor.hash("testpassword")
+
+    assert bcrypt_context().verify("testpassword", hashed_password)
+    assert await executor.verify("testpassword", hashed_password) is True
+    assert await executor.verify("wrongpassword", hashed_password) is False
+    executor.shutdown()
+
+# when all the slots are taken, next call should fail fast with 503 instead of waiting in queue
+@pytest.mark.asyncio
+async def test_hashing_executor_sheds_load_when_queue_full():
+    executor = HashingExecutor(workers = 1, max_pending = 1)
+
+    running = asyncio.create_task(executor.hash("testpassword"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await executor.hash("anotherpassword")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers == {'Retry-After': '1'}
+    assert executor.rejected == 1
+
+    await running
+    assert executor.pending == 0
+    executor.shutdown()
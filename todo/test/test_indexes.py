@@ -0,0 +1,50 @@
+from test.utils import *
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite, postgresql
+from models import TODO_SEARCH_DOCUMENT
+from search import ranked_select
+
+'''
+Query plan regression tests, if someone removes the owner indexes from models.py or changes the hot queries so that
+they can not use the indexes anymore, these tests fail because sqlite plan falls back to 'SCAN todos'.
+'''
+
+def query_plan(query):
+    # make sure indexes exist also in old test database file created before indexes were added
+    for index in Todos.__table__.indexes:
+        index.create(bind = engine, checkfirst = True)
+    sql = str(query.compile(dialect = sqlite.dialect(), compile_kwargs = {"literal_binds": True}))
+    with engine.connect() as connection:
+        return " ".join(row[3] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+def test_todo_list_uses_owner_index():
+    plan = query_plan(select(Todos).where(Todos.owner_id == 1).order_by(Todos.id).limit(51))
+
+    assert "USING INDEX ix_todos_owner_id_id" in plan
+    assert "SCAN" not in plan and "TEMP B-TREE" not in plan
+
+def test_todo_filtered_list_uses_owner_complete_priority_index():
+    query = (select(Todos).where(Todos.owner_id == 1).where(Todos.complete == False).where(Todos.priority >= 2)
+             .order_by(Todos.priority.desc(), Todos.id.desc()).limit(51))
+    plan = query_plan(query)
+
+    assert "USING INDEX ix_todos_owner_id_complete_priority" in plan
+    assert "SCAN" not in plan
+
+def test_todo_by_id_and_owner_does_not_scan():
+    plan = query_plan(select(Todos).where(Todos.id == 1).where(Todos.owner_id == 1))
+
+    assert "SCAN" not in plan
+
+def test_search_uses_fts_index():
+    plan = query_plan(ranked_select('sqlite', 1, ['code'], [Todos.id]))
+
+    # owner's todos come from owner index and are matched through FTS5 index, todos table is never scanned
+    assert "SEARCH todos USING" in plan
+    assert "todos_fts VIRTUAL TABLE INDEX" in plan
+
+# postgres can use GIN index only if search query has exactly the same expression as the index
+def test_postgres_search_matches_index_expression():
+    sql = str(ranked_select('postgresql', 1, ['code'], [Todos.id]).compile(dialect = postgresql.dialect()))
+
+    assert f"({TODO_SEARCH_DOCUMENT}) @@ to_tsquery('english'" in sql
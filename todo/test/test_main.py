@@ -1,6 +1,16 @@
 from fastapi.testclient import TestClient #The starlette.testclient module requires the httpx package to be installed.(pip install httpx)
 from main import app
 from fastapi import status
+from database import get_db
+from routers.auth import get_current_user
+from metrics import instrument_engine
+from test.utils import override_get_db, override_get_current_user, async_engine, test_todo, app_engine
+from main import create_app
+import pytest
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+instrument_engine(async_engine) # count statements of the test database engine as well
 
 client = TestClient(app)
 
@@ -8,4 +18,42 @@ def test_return_health_check():
     response = client.get("/healthy")
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {'status' : 'Healthy'}
-    
\ No newline at end of file
+
+# returns value of one sample line from /metrics (0 if it is not there yet), other tests may have run requests before
+def metric_value(sample):
+    for line in client.get("/metrics").text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+def test_metrics_exposition(test_todo, app_engine):
+    ok = 'http_requests_total{method="GET",route="/todos/todo/{todo_id}",status="200"}'
+    not_found = 'http_requests_total{method="GET",route="/todos/todo/{todo_id}",status="404"}'
+    statements = 'db_statements_per_request_sum{method="GET",route="/todos/todo/{todo_id}"}'
+    before = {sample: metric_value(sample) for sample in (ok, not_found, statements)}
+
+    client.get("/todos/todo/1")
+    client.get("/todos/todo/999")
+
+    assert metric_value(ok) == before[ok] + 1
+    assert metric_value(not_found) == before[not_found] + 1
+    # every read_todo call runs one statement (the todo with its version)
+    assert metric_value(statements) == before[statements] + 2
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_in_flight 1' in response.text.splitlines() # the /metrics request itself
+    assert 'db_pool{stat="checked_out"}' in response.text
+
+# app factory: engine is created when app starts, not at import, and schema is checked against alembic revisions
+def test_create_app_lifespan(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path}/startup.db"
+
+    with TestClient(create_app(database_url = url, schema_check = 'create_all')) as started_client:
+        assert started_client.get("/healthy").json() == {'status': 'Healthy'}
+
+    # new database has no alembic revision, app must refuse to start instead of running on a wrong schema
+    with pytest.raises(RuntimeError, match = "alembic upgrade head"):
+        with TestClient(create_app(database_url = url, schema_check = 'revision')):
+            pass
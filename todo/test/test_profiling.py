@@ -0,0 +1,78 @@
+from test.utils import *
+from datetime import timedelta
+from fastapi import FastAPI, status
+from database import get_db
+from routers.auth import get_current_user, create_access_token
+from profiling import ProfilingMiddleware, ProfileStore, profile_store
+import marshal
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+# middleware checks the token itself (not through dependency overrides), so real tokens are needed
+admin_token = create_access_token("codingwithckp", 1, "admin", timedelta(minutes = 20))
+user_token = create_access_token("someone", 2, "user", timedelta(minutes = 20))
+
+
+def test_admin_profiles_request(test_todo):
+    profile_store.clear()
+    response = client.get("/todos/todo/1", headers = {"X-Profile": "1", "Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == status.HTTP_200_OK
+    profile_id = response.headers["X-Profile-Id"]
+
+    profiles = client.get("/admin/profiles").json()
+    assert profiles[0]["id"] == profile_id
+    assert profiles[0]["route"] == "GET /todos/todo/{todo_id}"
+    assert profiles[0]["truncated"] is False
+
+    report = client.get(f"/admin/profiles/{profile_id}")
+    assert report.status_code == status.HTTP_200_OK
+    assert "read_todo" in report.text # endpoint function shows up in the profile
+
+    dump = client.get(f"/admin/profiles/{profile_id}", params = {"format": "pstats"})
+    assert isinstance(marshal.loads(dump.content), dict)
+
+def test_read_missing_profile():
+    response = client.get("/admin/profiles/unknown")
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Profile Not Found'}
+
+
+def profiled_app(**settings):
+    store = ProfileStore()
+    small_app = FastAPI()
+
+    @small_app.get("/work")
+    async def work():
+        return {"total": sum(range(1000))}
+
+    small_app.add_middleware(ProfilingMiddleware, get_user = get_current_user, store = store, **settings)
+    return TestClient(small_app), store
+
+def test_profile_only_for_flagged_admin_requests():
+    small_client, store = profiled_app(min_interval = 0)
+    assert "X-Profile-Id" not in small_client.get("/work", headers = {"Authorization": f"Bearer {admin_token}"}).headers
+    assert "X-Profile-Id" not in small_client.get("/work", headers = {"X-Profile": "1", "Authorization": f"Bearer {user_token}"}).headers
+    assert "X-Profile-Id" not in small_client.get("/work", headers = {"X-Profile": "1", "Authorization": "Bearer invalid"}).headers
+    assert "X-Profile-Id" in small_client.get("/work", params = {"profile": "1"}, headers = {"Cookie": f"access_token={admin_token}"}).headers
+    assert len(store.list()) == 1
+
+def test_profile_overhead_limits():
+    small_client, store = profiled_app(min_interval = 3600)
+    headers = {"X-Profile": "1", "Authorization": f"Bearer {admin_token}"}
+    # flagged request of other user is not profiled and does not use up the interval
+    assert "X-Profile-Id" not in small_client.get("/work", headers = {**headers, "Authorization": f"Bearer {user_token}"}).headers
+    assert "X-Profile-Id" in small_client.get("/work", headers = headers).headers
+    # second flagged request within min_interval is served normally, without profiling
+    assert "X-Profile-Id" not in small_client.get("/work", headers = headers).headers
+
+    small_client, store = profiled_app(sample_rate = 0)
+    assert "X-Profile-Id" not in small_client.get("/work", headers = headers).headers
+    assert store.list() == []
+
+def test_profile_has_token_decode():
+    small_client, store = profiled_app(min_interval = 0)
+    token = create_access_token("notcachedyet", 1, "admin", timedelta(minutes = 20)) # not in token_cache yet
+    response = small_client.get("/work", headers = {"X-Profile": "1", "Authorization": f"Bearer {token}"})
+    functions = store.get(response.headers["X-Profile-Id"]).stats.stats
+    assert any(function == 'decode' and 'jose' in file for file, _, function in functions)
@@ -0,0 +1,68 @@
+from test.utils import *
+from fastapi import FastAPI, Depends
+from typing import Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from routers.auth import get_current_user
+import query_diagnostics
+import logging
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+'''
+Number of statements every endpoint runs, if a change adds a query to an endpoint these tests fail.
+'''
+def test_read_all_query_count(test_user, test_todo, assert_num_queries):
+    with assert_num_queries(2): # owner version (ETag) + one page of todos
+        client.get("/todos")
+    with assert_num_queries(1): # second read comes from todo cache, only owner version is read
+        client.get("/todos")
+
+def test_read_todo_query_count(test_user, test_todo, assert_num_queries):
+    with assert_num_queries(1): # todo with its version (ETag), owner version is not needed
+        client.get("/todos/todo/1")
+
+def test_write_query_counts(test_user, test_todo, assert_num_queries):
+    update_request = {"title": "Count Queries", "description": "Counting", "priority": 1, "complete": False}
+    with assert_num_queries(2): # UPDATE todos ... RETURNING + owner version, stats are changed by a trigger
+        client.put("/todos/todo/1", json = update_request)
+    with assert_num_queries(3): # DELETE todos ... RETURNING + stats + owner version
+        client.delete("/todos/todo/1")
+
+def test_batch_query_counts(test_todo, assert_num_queries):
+    update_requests = [{"id": todo_id, "title": "Batch Todo", "description": "Updated in batch", "priority": 3, "complete": True}
+                       for todo_id in range(1, 51)]
+    # owned todos + one executemany UPDATE + todo versions + owner version, not one UPDATE per todo
+    with assert_num_queries(4):
+        client.put("/todos/batch", json = update_requests)
+    with assert_num_queries(3): # one DELETE ... RETURNING + stats + owner version
+        client.post("/todos/batch/delete", json = list(range(1, 51)))
+
+# A small app with diagnostics middleware, with zero thresholds every statement is slow and budget is always exceeded.
+# It has its own engine, install() listeners stay on the engine, so they are not added to the engine of the other tests.
+def test_slow_query_and_budget_logging(caplog):
+    diagnostics_engine = create_async_engine(url = "sqlite+aiosqlite://", poolclass = NullPool)
+    query_diagnostics.install(diagnostics_engine)
+    diagnostics_app = FastAPI()
+
+    @diagnostics_app.get("/many/{count}")
+    async def run_many(count: int, db: Annotated[AsyncSession, Depends(get_db)]):
+        for _ in range(count):
+            await db.execute(text("SELECT 1"))
+        return {}
+
+    async def diagnostics_db():
+        async with AsyncSession(diagnostics_engine) as db:
+            yield db
+
+    diagnostics_app.dependency_overrides[get_db] = diagnostics_db
+    diagnostics_app.add_middleware(query_diagnostics.QueryDiagnosticsMiddleware, slow_query_ms = 0, query_budget = 2)
+
+    with caplog.at_level(logging.WARNING, logger = "todo.sql"):
+        TestClient(diagnostics_app).get("/many/3")
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert sum(message.startswith("slow query") and "GET /many/{count}" in message for message in messages) == 3
+    assert any("query budget exceeded: GET /many/{count} ran 3 statements (budget 2)" in message and "3x SELECT 1" in message
+               for message in messages)
@@ -0,0 +1,82 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from main import create_app
+from models import Todos, Users
+from replicas import PRIMARY_COOKIE, ReplicaSet, replicas
+from routers.auth import get_current_user
+from test.utils import clear_todo_cache, override_get_current_user
+
+'''
+Primary and replica are two separate sqlite files here, replica gets a different todo than primary,
+so every response shows which database it was read from. Replica never gets the writes, like a lagging one.
+Todo lists are cached (check todo_cache.py), the tests read through the cache as the app does.
+'''
+
+def make_database(path, title):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind = engine)
+    with sessionmaker(bind = engine)() as db:
+        db.add(Users(id = 1, username = 'test', email = 'test@email.com', hashed_password = 'hash', role = 'admin'))
+        db.add(Todos(title = title, description = title, priority = 1, complete = False, owner_id = 1))
+        db.commit()
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+def replicated_app(tmp_path, replica_urls):
+    app = create_app(database_url = make_database(tmp_path / "primary.db", "on primary"),
+                     schema_check = 'off', replica_urls = replica_urls)
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    return app
+
+def titles(client, cookies = True):
+    if cookies:
+        return [todo['title'] for todo in client.get("/todos/").json()]
+    saved = dict(client.cookies)
+    client.cookies.clear()
+    try:
+        return [todo['title'] for todo in client.get("/todos/").json()]
+    finally:
+        client.cookies.update(saved)
+
+
+def test_reads_from_replica_and_writes_to_primary(tmp_path):
+    app = replicated_app(tmp_path, [make_database(tmp_path / "replica.db", "on replica")])
+    with TestClient(app) as client:
+        assert titles(client) == ['on replica']
+
+        response = client.post("/todos/todo", json = {'title': 'new todo', 'description': 'new todo', 'priority': 2, 'complete': False})
+        assert response.status_code == 201
+        assert PRIMARY_COOKIE in response.cookies
+
+        # other user's read from the lagging replica right after the write is cached under replica's (older) version
+        assert titles(client, cookies = False) == ['on replica']
+        # read your writes: user who just wrote reads from primary, which already has the new todo, not the cached list
+        assert titles(client) == ['on primary', 'new todo']
+
+        client.cookies.clear()
+        assert titles(client) == ['on replica']
+        # sessions of other methods always use primary
+        assert client.get("/healthy").json() == {'status': 'Healthy'}
+
+
+def test_unhealthy_replica_is_skipped(tmp_path):
+    app = replicated_app(tmp_path, [f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"])
+    with TestClient(app) as client:
+        client.portal.call(replicas.check)
+        assert list(replicas.healthy.values()) == [False]
+        assert titles(client) == ['on primary']
+
+
+def test_replica_round_robin():
+    replica_set = ReplicaSet()
+    assert replica_set.choose() is None
+
+    replica_set.configure(['first', 'second'])
+    assert [replica_set.choose() for _ in range(4)] in (['first', 'second'] * 2, ['second', 'first'] * 2)
+
+    replica_set.healthy['first'] = False
+    assert {replica_set.choose() for _ in range(3)} == {'second'}
+    replica_set.healthy['second'] = False
+    assert replica_set.choose() is None
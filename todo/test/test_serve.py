@@ -0,0 +1,60 @@
+from serve import rss_bytes
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import pytest
+
+'''
+Starts the real multi process server (python -m todo serve) on a temporary sqlite database.
+'''
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_healthy(port, timeout = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthy", timeout = 1) as response:
+                return response.status
+        except OSError:
+            time.sleep(0.05)
+    raise AssertionError("server did not start")
+
+def serve(tmp_path, port, *arguments, schema_check = "create_all"):
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path}/serve.db", "DB_SCHEMA_CHECK": schema_check}
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return subprocess.Popen([sys.executable, "-m", "todo", "serve", "--port", str(port), "--log-level", "warning", *arguments],
+                            cwd = root, env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason = "serve needs fork")
+def test_workers_are_recycled_after_max_requests(tmp_path):
+    port = free_port()
+    server = serve(tmp_path, port, "--workers", "2", "--max-requests", "3")
+    try:
+        assert wait_until_healthy(port) == 200
+        # every worker exits after 3 requests, parent starts a new one, clients only see a short wait at most
+        for _ in range(12):
+            assert wait_until_healthy(port) == 200
+    finally:
+        server.terminate()
+        output, _ = server.communicate(timeout = 40)
+    assert server.returncode == 0
+    assert "Maximum request limit of 3 exceeded" in output
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason = "serve needs fork")
+def test_wrong_schema_stops_before_workers_start(tmp_path):
+    server = serve(tmp_path, free_port(), schema_check = "revision")
+    output, _ = server.communicate(timeout = 40)
+
+    assert server.returncode == 1
+    assert "alembic upgrade head" in output
+    assert "workers on" not in output
+
+def test_rss_bytes():
+    assert rss_bytes(os.getpid()) > 0 or not os.path.exists("/proc")
@@ -0,0 +1,144 @@
+from fastapi.testclient import TestClient
+from database import get_sessionmaker
+from group_commit import GroupCommitter
+from main import create_app
+from routers.todos import TodoRequest
+from routers.auth import get_current_user
+from shard_map import ShardMap, shards
+from sharding import move_bucket, todo_ids
+from todo_cache import todo_cache
+from test.utils import override_get_current_user
+import asyncio
+import json
+import pytest
+import shard_map
+import sqlite3
+
+'''
+Main database and two shards are separate sqlite files. Map has 4 buckets: owner 1 (the test user) is in bucket 1
+which starts in shard 'b', owner 2 is in bucket 2 in shard 'a'.
+'''
+
+TODO = {'title': 'buy groceries', 'description': 'milk and bread', 'priority': 3, 'complete': False}
+
+def rows(path, query = "SELECT id, owner_id FROM todos ORDER BY id"):
+    with sqlite3.connect(path) as connection:
+        return connection.execute(query).fetchall()
+
+def titles(client):
+    asyncio.run(todo_cache.clear()) # only the databases are tested here
+    return [todo['title'] for todo in client.get("/todos/").json()]
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    monkeypatch.setattr(shard_map, 'SHARD_MAP_RELOAD', 0) # every request sees the newest map
+    todo_ids.reset() # ids reserved in main database of other test
+    files = {name: tmp_path / f"{name}.db" for name in ('main', 'a', 'b')}
+    map_path = str(tmp_path / "shards.json")
+    ShardMap({name: f"sqlite+aiosqlite:///{files[name]}" for name in ('a', 'b')}, ['a', 'b', 'a', 'b']).save(map_path)
+    app = create_app(database_url = f"sqlite+aiosqlite:///{files['main']}", schema_check = 'create_all', shard_map = map_path)
+    app.dependency_overrides[get_current_user] = override_get_current_user
+    with TestClient(app) as client:
+        yield client, files, map_path
+
+
+def test_todos_are_written_and_read_in_owner_shard(sharded):
+    client, files, _ = sharded
+    # todo made before this worker reserved ids, new ids must not collide with it
+    with sqlite3.connect(files['a']) as connection:
+        connection.execute("INSERT INTO todos (id, title, description, priority, complete, owner_id, version) "
+                           "VALUES (1000, 'old todo', 'other owner', 1, 0, 2, 1)")
+
+    assert client.post("/todos/todo", json = TODO).status_code == 201
+    batch = client.post("/todos/batch", json = [TODO, TODO]).json()
+
+    assert [todo_id for todo_id, owner_id in rows(files['b'])] == [1001] + [result['id'] for result in batch]
+    assert rows(files['a']) == [(1000, 2)]
+    assert rows(files['main']) == []
+    assert rows(files['main'], "SELECT name, next_id > 1003 FROM id_counters") == [('todos', 1)]
+
+    assert titles(client) == ['buy groceries'] * 3
+    assert len(client.get("/todos/search", params = {'q': 'groc'}).json()) == 3
+    assert client.get("/todos/stats").json()['total'] == 3
+    assert client.put("/todos/todo/1001", json = {**TODO, 'complete': True}).status_code == 204
+    assert client.get("/todos/stats").json()['completed'] == 1
+
+
+def test_admin_queries_scatter_over_shards(sharded):
+    client, files, _ = sharded
+    with sqlite3.connect(files['a']) as connection:
+        connection.execute("INSERT INTO todos (id, title, description, priority, complete, owner_id, version) "
+                           "VALUES (1000, 'old todo', 'other owner', 1, 0, 2, 1)")
+    client.post("/todos/todo", json = TODO)
+
+    response = client.get("/admin/todo/", params = {'limit': 1, 'sort': '-id'})
+    assert [todo['id'] for todo in response.json()] == [1001]
+    next_page = client.get("/admin/todo/", params = {'limit': 1, 'sort': '-id', 'cursor': response.headers['X-Next-Cursor']})
+    assert [todo['id'] for todo in next_page.json()] == [1000]
+    assert len(client.get("/admin/todo/export").text.splitlines()) == 2
+
+    assert client.post("/admin/stats/rebuild").json() == {'users': 2}
+    assert client.get("/admin/stats").json()['total'] == 2
+    assert client.get("/admin/stats", params = {'owner_id': 2}).json()['total'] == 1
+
+    assert client.delete("/admin/todo/1000").status_code == 204
+    assert rows(files['a']) == []
+    assert client.delete("/admin/todo/1000").status_code == 404
+    assert client.get("/admin/stats", params = {'owner_id': 2}).json()['total'] == 0
+
+
+def test_move_bucket_to_other_shard(sharded):
+    client, files, map_path = sharded
+    client.post("/todos/batch", json = [TODO, {**TODO, 'title': 'walk the dog'}])
+
+    moved = client.portal.call(lambda: move_bucket(map_path, 1, 'a', wait = 0, log = lambda message: None))
+
+    assert moved == 2
+    assert rows(files['b']) == [] and rows(files['b'], "SELECT * FROM todo_stats") == []
+    assert [owner_id for _, owner_id in rows(files['a'])] == [1, 1]
+    assert ShardMap.load(map_path).buckets == ['a', 'a', 'a', 'b'] and not ShardMap.load(map_path).frozen
+    # app follows the map, same todos and stats are read from the new shard and new todos go there
+    assert titles(client) == ['buy groceries', 'walk the dog']
+    assert client.get("/todos/stats").json()['total'] == 2
+    assert client.post("/todos/todo", json = TODO).status_code == 201
+    assert len(rows(files['a'])) == 3
+
+
+def test_group_commit_writes_one_batch_per_shard(sharded):
+    client, files, _ = sharded
+    with sqlite3.connect(files['a']) as connection:
+        # inserts of owner 2 (shard 'a') fail
+        connection.execute("CREATE TRIGGER broken BEFORE INSERT ON todos BEGIN SELECT RAISE(ABORT, 'shard is down'); END")
+    committer = GroupCommitter(window_ms = 50, max_items = 10)
+
+    async def create_for_both_owners():
+        return await asyncio.gather(*(committer.submit(get_sessionmaker(), owner_id, TodoRequest(**TODO)) for owner_id in (1, 2)),
+                                    return_exceptions = True)
+
+    stored, failed = client.portal.call(create_for_both_owners)
+    # same window, but owner 1 is in shard 'b', so its todo is in a batch (and transaction) of its own
+    assert isinstance(failed, Exception)
+    assert rows(files['b']) == [(stored, 1)]
+    assert (committer.batches, committer.items) == (1, 1)
+
+
+def test_writes_of_frozen_bucket_are_refused(sharded):
+    client, _, map_path = sharded
+    with open(map_path) as file:
+        frozen = {**json.load(file), 'frozen': [1]}
+    with open(map_path, 'w') as file:
+        json.dump(frozen, file)
+
+    response = client.post("/todos/todo", json = TODO)
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert client.get("/todos/").status_code == 200
+
+
+def test_shard_map():
+    example = ShardMap({"a": "sqlite://", "b": "sqlite://"}, ["a", "b", "b"], frozen = [2])
+    assert [example.shard_for(owner_id) for owner_id in (3, 4, 5)] == ['a', 'b', 'b']
+    assert example.is_frozen(5) and not example.is_frozen(4)
+    with pytest.raises(ValueError):
+        ShardMap({'a': 'sqlite://'}, ['a', 'c'])
+    assert shards.names() == [None] # sharding is off outside of the fixture
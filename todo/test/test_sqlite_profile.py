@@ -0,0 +1,115 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+import asyncio
+import database
+import pytest
+import sqlite_profile
+
+'''
+Engines made by database._create_engine() with DB_SQLITE_PROFILE=production, on a sqlite file of their own.
+'''
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_profile, 'SQLITE_PROFILE', 'production')
+    url = f"sqlite+aiosqlite:///{tmp_path / 'profile.db'}"
+    return url, async_sessionmaker(class_ = AsyncSession, sync_session_class = database.RoutingSession, expire_on_commit = False)
+
+async def pragmas(engine) -> tuple:
+    async with engine.connect() as connection:
+        return tuple([(await connection.exec_driver_sql(f'PRAGMA {name}')).scalar()
+                      for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')])
+
+
+@pytest.mark.asyncio
+async def test_pragmas_are_set_on_every_connection(profiled):
+    url, _ = profiled
+    engine = database._create_engine(url)
+    assert await pragmas(engine) == ('wal', 1, 5000, -65536, 256 * 1024 * 1024)
+    await engine.dispose()
+
+    sqlite_profile.SQLITE_PROFILE = 'default'
+    engine = database._create_engine(url.replace('profile.db', 'default.db')) # WAL stays in the file, so a new one
+    assert (await pragmas(engine))[:2] == ('delete', 2) # rollback journal, synchronous=FULL
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_writers_which_read_first_do_not_fail(profiled):
+    url, sessions = profiled
+    engine = database._create_engine(url)
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql('CREATE TABLE counter (value INTEGER)')
+        await connection.exec_driver_sql('INSERT INTO counter VALUES (0)')
+
+    # read, yield to the other writers, then write - with deferred BEGIN these fail with 'database is locked'
+    async def increment():
+        async with sessions(bind = engine) as db:
+            value = (await db.execute(text('SELECT value FROM counter'))).scalar()
+            await asyncio.sleep(0.01)
+            await db.execute(text('UPDATE counter SET value = :value'), {'value': value + 1})
+            await db.commit()
+
+    await asyncio.gather(*(increment() for _ in range(10)))
+
+    async with engine.connect() as connection:
+        assert (await connection.exec_driver_sql('SELECT value FROM counter')).scalar() == 10
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_read_only_session_does_not_wait_for_writer(profiled):
+    url, sessions = profiled
+    engine = database._create_engine(url)
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql('CREATE TABLE notes (text VARCHAR)')
+
+    async with sessions(bind = engine) as writer, sessions(bind = engine, info = {'read_only': True}) as reader:
+        await writer.execute(text("INSERT INTO notes VALUES ('not committed')"))
+        assert (await asyncio.wait_for(reader.execute(text('SELECT count(*) FROM notes')), 1)).scalar() == 0
+        await writer.commit()
+    assert engine.pool.checkedout() == 0
+    await engine.dispose()
+
+
+def test_unknown_profile_is_refused(monkeypatch):
+    monkeypatch.setattr(sqlite_profile, 'SQLITE_PROFILE', 'fast')
+    with pytest.raises(ValueError):
+        database._create_engine('sqlite+aiosqlite://')
+    assert not sqlite_profile.uses_profile('postgresql+asyncpg://user@host/db', 'production')
+
+
+@pytest.mark.asyncio
+async def test_second_connection_of_same_task_does_not_wait_for_its_lock(profiled, monkeypatch):
+    monkeypatch.setattr(sqlite_profile, 'SQLITE_BUSY_TIMEOUT_MS', 500)
+    url, _ = profiled
+    engine = database._create_engine(url)
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql('CREATE TABLE notes (text VARCHAR)')
+
+    async with engine.connect() as first:
+        await first.exec_driver_sql("INSERT INTO notes VALUES ('first')")
+        await first.commit() # connection keeps the lock until it goes back to pool
+        async with engine.begin() as second:
+            await second.exec_driver_sql("INSERT INTO notes VALUES ('second')")
+    async with engine.connect() as connection:
+        assert (await connection.exec_driver_sql('SELECT count(*) FROM notes')).scalar() == 2
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_read_only_engine_does_not_take_write_lock(profiled):
+    url, _ = profiled
+    engine = database._create_engine(url)
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql('CREATE TABLE notes (text VARCHAR)')
+
+    async def read():
+        async with sqlite_profile.read_only_engine(engine).connect() as connection:
+            return (await connection.exec_driver_sql('SELECT count(*) FROM notes')).scalar()
+
+    async with engine.begin() as writer:
+        await writer.exec_driver_sql("INSERT INTO notes VALUES ('not committed')")
+        assert await asyncio.wait_for(asyncio.create_task(read()), 1) == 0 # other task, writer holds the lock
+    assert sqlite_profile.read_only_engine(engine).sync_engine is not engine.sync_engine
+    await engine.dispose()
@@ -0,0 +1,66 @@
+from test.utils import *
+from todo_cache import MemoryBackend, RedisBackend, TodoListCache
+import fakeredis
+import pytest
+
+# Second read is served from cache (todo inserted directly in db is not visible), create endpoint changes user's version
+# and so the cache key.
+def test_read_all_served_from_cache_until_todo_changes(test_user, test_todo):
+    assert len(client.get("/todos").json()) == 1
+
+    db = TestingSessionLocal()
+    db.add(Todos(title = 'Not Through Api', description = 'Inserted directly', priority = 1, complete = False, owner_id = 1))
+    db.commit()
+    db.close()
+    assert len(client.get("/todos").json()) == 1
+
+    response = client.post("/todos/todo", json = {"title": "New Todo", "description": "A new Todo", "priority": 3, "complete": False})
+    assert response.status_code == 201
+    assert len(client.get("/todos").json()) == 3
+
+# write committed by another worker (nothing happens in this worker's cache) is seen at once, version comes from database
+def test_write_of_other_worker_is_seen(test_user, test_todo):
+    assert [todo['title'] for todo in client.get("/todos").json()] == ['Learn To Code']
+
+    db = TestingSessionLocal()
+    db.add(Todos(title = 'Other Worker', description = 'Written by other worker', priority = 1, complete = False, owner_id = 1))
+    db.execute(text("UPDATE users SET version = version + 1 WHERE id = 1"))
+    db.commit()
+    db.close()
+    assert [todo['title'] for todo in client.get("/todos").json()] == ['Learn To Code', 'Other Worker']
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_by_size():
+    backend = MemoryBackend(max_bytes = 10)
+
+    await backend.set("first", b"12345", ttl = 60)
+    await backend.set("second", b"12345", ttl = 60)
+    await backend.get("first") # 'first' is now most recently used
+    await backend.set("third", b"123", ttl = 60)
+
+    assert await backend.get("second") is None
+    assert await backend.get("first") == b"12345"
+    assert backend.size == 8
+
+    await backend.set("expired", b"1", ttl = 0)
+    assert await backend.get("expired") is None
+
+# redis backend is tested against fakeredis which speaks the same commands as real redis server
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend_factory", [MemoryBackend, lambda: RedisBackend(client = fakeredis.FakeAsyncRedis())])
+async def test_todo_list_cache_is_keyed_by_version(backend_factory):
+    cache = TodoListCache(backend_factory(), ttl = 60)
+
+    key = cache.key(1, 1, "page")
+    assert await cache.get(key) is None
+    await cache.set(key, [{"id": 1, "title": "Learn To Code"}])
+    assert await cache.get(cache.key(1, 1, "page")) == [{"id": 1, "title": "Learn To Code"}]
+
+    assert await cache.get(cache.key(1, 2, "page")) is None
+    assert await cache.get(cache.key(2, 1, "page")) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # owner without users row has no version, nothing is cached for it
+    assert cache.key(1, None, "page") is None
+    await cache.set(None, [])
+    assert await cache.get(None) is None
@@ -0,0 +1,104 @@
+from test.utils import *
+from database import get_db
+from routers.auth import get_current_user
+from todo_events import EventHub, MemoryBackend, RedisBackend, todo_events, event_stream
+from fastapi import HTTPException
+import asyncio
+import routers.todos
+import fakeredis
+import pytest
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+@pytest.mark.asyncio
+async def test_events_go_only_to_owner_streams():
+    hub = EventHub(MemoryBackend())
+    first_tab, second_tab = await hub.subscribe(1), await hub.subscribe(1)
+    other_user = await hub.subscribe(2)
+
+    await hub.publish(1, 'deleted', [{'id': 5}])
+
+    assert first_tab.queue.get_nowait() == {'type': 'deleted', 'todos': [{'id': 5}]}
+    assert second_tab.queue.get_nowait() == {'type': 'deleted', 'todos': [{'id': 5}]}
+    assert other_user.queue.empty()
+
+    hub.unsubscribe(first_tab)
+    hub.unsubscribe(second_tab)
+    assert 1 not in hub.subscribers
+
+# slow client never blocks publisher, its queue is replaced with one 'resync' event
+@pytest.mark.asyncio
+async def test_full_queue_turns_into_resync():
+    hub = EventHub(MemoryBackend(), queue_size = 2, max_streams = 1)
+    subscriber = await hub.subscribe(1)
+    for todo_id in range(3):
+        await hub.publish(1, 'deleted', [{'id': todo_id}])
+
+    assert subscriber.queue.get_nowait() == {'type': 'resync'}
+    assert subscriber.queue.empty()
+    assert subscriber.dropped == 3
+
+    with pytest.raises(HTTPException) as error:
+        await hub.subscribe(1)
+    assert error.value.status_code == 429
+
+# two hubs are two workers, redis backend brings event of one worker to streams of the other
+@pytest.mark.asyncio
+async def test_redis_backend_fans_out_to_other_workers():
+    server = fakeredis.FakeServer()
+    publisher = EventHub(RedisBackend(client = fakeredis.FakeAsyncRedis(server = server)))
+    listener = EventHub(RedisBackend(client = fakeredis.FakeAsyncRedis(server = server)))
+    await publisher.start()
+    subscriber = await listener.subscribe(1)
+
+    await publisher.publish(1, 'created', [{'id': 1, 'title': 'From Other Worker'}])
+
+    assert await subscriber.next(timeout = 2) == {'type': 'created', 'todos': [{'id': 1, 'title': 'From Other Worker'}]}
+    await publisher.stop()
+    await listener.stop()
+
+@pytest.mark.asyncio
+async def test_event_stream_format():
+    class Request:
+        calls = 0
+        async def is_disconnected(self):
+            self.calls += 1
+            return self.calls > 2
+
+    hub = EventHub(MemoryBackend())
+    stream = event_stream(hub, 1, Request(), heartbeat = 0.01)
+    chunks = [await stream.__anext__()] # stream subscribes when it starts
+    await hub.publish(1, 'deleted', [{'id': 5}])
+    chunks += [chunk async for chunk in stream]
+
+    assert chunks == ['retry: 3000\n\n', 'event: deleted\ndata: [{"id": 5}]\n\n', ': ping\n\n']
+    assert hub.subscribers == {} # stream unsubscribes when client is gone
+
+# response whose body is never sent (client gone before it started) must not keep a subscriber
+def test_event_stream_not_started_keeps_no_subscriber(monkeypatch):
+    hub = EventHub(MemoryBackend(), max_streams = 1)
+    monkeypatch.setattr(routers.todos, 'todo_events', hub)
+
+    for _ in range(3):
+        response = asyncio.run(routers.todos.stream_events({'id': 1}, None))
+        assert response.media_type == 'text/event-stream'
+    assert hub.subscribers == {}
+
+# write endpoints publish events after commit
+def test_write_endpoints_publish_events(test_todo):
+    subscriber = asyncio.run(todo_events.subscribe(1))
+    try:
+        todo_request = {"title": "Live Todo", "description": "Shows up without reload", "priority": 3, "complete": False}
+        client.post("/todos/todo", json = todo_request)
+        assert subscriber.queue.get_nowait() == {'type': 'created', 'todos': [{**todo_request, 'id': 2, 'owner_id': 1, 'version': 1}]}
+
+        client.put("/todos/todo/2", json = {**todo_request, "complete": True})
+        assert subscriber.queue.get_nowait()['todos'] == [{**todo_request, 'complete': True, 'id': 2, 'owner_id': 1, 'version': 2}]
+
+        client.post("/todos/batch/delete", json = [1, 2])
+        event = subscriber.queue.get_nowait()
+        assert event['type'] == 'deleted' and sorted(todo['id'] for todo in event['todos']) == [1, 2]
+        assert subscriber.queue.empty()
+    finally:
+        todo_events.unsubscribe(subscriber)
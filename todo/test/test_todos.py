@@ -1,4 +1,6 @@
 from routers.todos import get_db, get_current_user
+from routers.auth import create_access_token
+from datetime import timedelta
 from fastapi import status
 from models import Todos
 from test.utils import *
@@ -13,7 +15,7 @@ def test_read_all_authenticated(test_todo):
     assert respone.json() == [{
         'title':'Learn To Code', 
         'description':'Learn To Code Everyday', 
-        'priority':5, 'complete':True, 'owner_id':1, 'id':1}] # return type is list of json string
+        'priority':5, 'complete':True, 'owner_id':1, 'id':1, 'version':1}] # return type is list of json string
 
 # This function will test one todo for a specific todo_id, here todo_id is 1 which is client requesting.
 def test_read_authenticated(test_todo):
@@ -23,7 +25,7 @@ def test_read_authenticated(test_todo):
         'title':'Learn To Code', 
         'description':'Learn To Code Everyday', 
         'priority':5, 'complete':True, 
-        'owner_id':1, 'id':1} # return type is just one json string(return is todo for one todo_id)
+        'owner_id':1, 'id':1, 'version':1} # return type is just one json string(return is todo for one todo_id)
 
 # This function will test the todo which is not existing in database
 def test_read_one_authenticated_not_found():
@@ -107,3 +109,268 @@ def test_delete_todo_not_found():
     assert response.status_code == 404
     assert response.json() == {"detail":"Todo Not Found"}
 
+# This function adds few more todos for the same owner, used by pagination tests below. Cleanup is done by 'test_todo' fixture.
+def add_todos(priorities):
+    db = TestingSessionLocal()
+    for number, priority in enumerate(priorities):
+        db.add(Todos(title = f'Todo {number}', description = 'Paginated todo', priority = priority,
+                     complete = number % 2 == 0, owner_id = 1))
+    db.commit()
+    db.close()
+
+# Walk through all pages using cursor from 'X-Next-Cursor' header, every todo should come exactly once.
+def test_read_all_paginated(test_todo):
+    add_todos([1, 2, 3, 4, 5, 1, 2])
+
+    ids = []
+    response = client.get("/todos", params = {"limit": 3})
+    while True:
+        assert response.status_code == 200
+        assert len(response.json()) <= 3
+        ids += [todo['id'] for todo in response.json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        response = client.get("/todos", params = {"limit": 3, "cursor": cursor})
+
+    assert ids == list(range(1, 9))
+
+def test_read_all_sorted_by_priority_with_filters(test_todo):
+    add_todos([1, 2, 3, 4, 5, 1, 2]) # todos with id 3, 5 and 7 are not complete
+
+    params = {"sort": "-priority", "priority_min": 2, "complete": False, "limit": 1}
+    response = client.get("/todos", params = params)
+    assert response.status_code == 200
+    assert [(todo['priority'], todo['id']) for todo in response.json()] == [(4, 5)]
+
+    response = client.get("/todos", params = {**params, "cursor": response.headers['X-Next-Cursor']})
+    assert [(todo['priority'], todo['id']) for todo in response.json()] == [(2, 3)]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_read_all_invalid_cursor():
+    response = client.get("/todos", params = {"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'Invalid Cursor'}
+
+def test_create_todos_batch(test_todo):
+    todo_requests = [{"title": f"Batch Todo {number}", "description": "Created in batch", "priority": 3, "complete": False}
+                     for number in range(3)]
+
+    response = client.post("/todos/batch", json = todo_requests)
+    assert response.status_code == 200
+    assert response.json() == [{"id": 2, "status": 201}, {"id": 3, "status": 201}, {"id": 4, "status": 201}]
+
+    db = TestingSessionLocal()
+    assert [todo.title for todo in db.query(Todos).filter(Todos.id > 1).order_by(Todos.id)] == [
+        "Batch Todo 0", "Batch Todo 1", "Batch Todo 2"]
+
+def test_create_todos_batch_invalid_item():
+    todo_requests = [{"title": "Batch Todo", "description": "Created in batch", "priority": 3, "complete": False},
+                     {"title": "Batch Todo", "description": "Created in batch", "priority": 9, "complete": False}]
+
+    response = client.post("/todos/batch", json = todo_requests)
+    assert response.status_code == 422
+
+def test_update_todos_batch(test_todo):
+    add_todos([1])
+    db = TestingSessionLocal()
+    db.add(Todos(title = 'Other User Todo', description = 'Owned by user 2', priority = 1, complete = False, owner_id = 2))
+    db.commit()
+
+    update_request = {"title": "Updated In Batch", "description": "Updated", "priority": 2, "complete": True}
+    response = client.put("/todos/batch", json = [{**update_request, "id": 1}, {**update_request, "id": 3},
+                                                  {**update_request, "id": 2}, {**update_request, "id": 999}])
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "status": 204}, {"id": 3, "status": 404},
+                               {"id": 2, "status": 204}, {"id": 999, "status": 404}]
+
+    db.expire_all()
+    assert [todo.title for todo in db.query(Todos).order_by(Todos.id)] == [
+        "Updated In Batch", "Updated In Batch", "Other User Todo"]
+
+def test_delete_todos_batch(test_todo):
+    add_todos([1])
+
+    response = client.post("/todos/batch/delete", json = [1, 999, 2])
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "status": 204}, {"id": 999, "status": 404}, {"id": 2, "status": 204}]
+
+    db = TestingSessionLocal()
+    assert db.query(Todos).count() == 0
+
+# Client sends ETag it received back in 'If-None-Match', until something changes answer is 304 with empty body.
+def test_read_all_etag_not_modified_until_todo_changes(test_user, test_todo):
+    response = client.get("/todos")
+    etag = response.headers['ETag']
+
+    response = client.get("/todos", headers = {"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    client.put("/todos/todo/1", json = {"title": "Changed Title", "description": "Changed", "priority": 1, "complete": False})
+
+    response = client.get("/todos", headers = {"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json()[0]['title'] == "Changed Title"
+
+# list is cached by this worker, then changed by another one: ETag and body must both be of the new version,
+# otherwise the old list would be sent under the new ETag and kept by client as 'not modified'
+def test_read_all_etag_and_cached_list_are_of_same_version(test_user, test_todo):
+    etag = client.get("/todos").headers['ETag']
+
+    db = TestingSessionLocal()
+    db.execute(text("UPDATE todos SET title = 'Changed Elsewhere' WHERE id = 1"))
+    db.execute(text("UPDATE users SET version = version + 1 WHERE id = 1"))
+    db.commit()
+    db.close()
+
+    response = client.get("/todos", headers = {"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]['title'] == 'Changed Elsewhere'
+    assert client.get("/todos", headers = {"If-None-Match": response.headers['ETag']}).status_code == 304
+
+def test_read_todo_etag(test_user, test_todo):
+    etag = client.get("/todos/todo/1").headers['ETag']
+
+    assert client.get("/todos/todo/1", headers = {"If-None-Match": etag}).status_code == 304
+    assert client.get("/todos/todo/1", headers = {"If-None-Match": '"other"'}).status_code == 200
+
+def test_read_all_sparse_fields(test_todo):
+    response = client.get("/todos", params = {"fields": "title,complete"})
+    assert response.status_code == 200
+    assert response.json() == [{"title": "Learn To Code", "complete": True}]
+
+    response = client.get("/todos/todo/1", params = {"fields": "id,description"})
+    assert response.json() == {"id": 1, "description": "Learn To Code Everyday"}
+
+def test_read_all_sparse_fields_with_priority_cursor(test_todo):
+    add_todos([1, 2])
+
+    response = client.get("/todos", params = {"fields": "title", "sort": "priority", "limit": 2})
+    assert response.json() == [{"title": "Todo 0"}, {"title": "Todo 1"}]
+
+    response = client.get("/todos", params = {"fields": "title", "sort": "priority", "limit": 2,
+                                              "cursor": response.headers["X-Next-Cursor"]})
+    assert response.json() == [{"title": "Learn To Code"}]
+
+def test_read_all_unknown_field():
+    response = client.get("/todos", params = {"fields": "title,owner"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid Fields: owner"}
+
+# Optimistic concurrency, update with If-Match works only when client has the current version of the todo.
+def test_update_todo_if_match(test_todo):
+    update_request = {"title": "Changed With Version", "description": "Changed", "priority": 1, "complete": False}
+
+    response = client.put("/todos/todo/1", json = update_request, headers = {"If-Match": '"1"'})
+    assert response.status_code == 204
+    assert response.headers["ETag"] == '"2"'
+
+    response = client.put("/todos/todo/1", json = update_request, headers = {"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert response.json() == {"detail": "Todo Was Changed"}
+    assert response.headers["ETag"] == '"2"'
+
+    response = client.put("/todos/todo/999", json = update_request, headers = {"If-Match": '"1"'})
+    assert response.status_code == 404
+
+# ETag of GET is sent back as it is in If-Match, an ETag which is not a todo version is simply outdated (412)
+def test_read_todo_etag_is_accepted_by_if_match(test_todo):
+    update_request = {"title": "Changed With ETag", "description": "Changed", "priority": 1, "complete": False}
+    etag = client.get("/todos/todo/1").headers["ETag"]
+    assert etag == '"1"'
+
+    response = client.put("/todos/todo/1", json = update_request, headers = {"If-Match": etag})
+    assert response.status_code == 204
+    assert client.get("/todos/todo/1").headers["ETag"] == response.headers["ETag"] == '"2"'
+
+    assert client.put("/todos/todo/1", json = update_request, headers = {"If-Match": etag}).status_code == 412
+    assert client.delete("/todos/todo/1", headers = {"If-Match": '"0f3a9c"'}).status_code == 412
+
+def test_delete_todo_if_match(test_todo):
+    assert client.delete("/todos/todo/1", headers = {"If-Match": '"5"'}).status_code == 412
+    assert client.delete("/todos/todo/1", headers = {"If-Match": 'not-a-version'}).status_code == 400
+    assert client.delete("/todos/todo/1", headers = {"If-Match": '"1"'}).status_code == 204
+
+# Full text search, index is kept in sync by database triggers, so todos created/changed in any way are found.
+def test_search_todos_ranked(test_todo):
+    db = TestingSessionLocal()
+    db.add(Todos(title = 'Buy groceries', description = 'Milk and bread', priority = 2, complete = False, owner_id = 1))
+    db.add(Todos(title = 'Call mom', description = 'Ask about groceries list', priority = 3, complete = False, owner_id = 1))
+    db.add(Todos(title = 'Groceries for other user', description = 'Not visible', priority = 3, complete = False, owner_id = 2))
+    db.commit()
+    db.close()
+
+    response = client.get("/todos/search", params = {"q": "grocer", "fields": "title"})
+    assert response.status_code == 200
+    # match in title ranks higher than match in description, todos of other users are never returned
+    assert response.json() == [{"title": "Buy groceries"}, {"title": "Call mom"}]
+
+    assert client.get("/todos/search", params = {"q": "learn code"}).json()[0]["title"] == "Learn To Code"
+    assert client.get("/todos/search", params = {"q": "learn groceries"}).json() == []
+    assert client.get("/todos/search", params = {"q": "\"*)("}).json() == []
+
+def test_search_follows_updates_and_deletes(test_todo):
+    update_request = {"title": "Water the plants", "description": "Balcony plants", "priority": 1, "complete": False}
+    client.put("/todos/todo/1", json = update_request)
+    assert client.get("/todos/search", params = {"q": "code"}).json() == []
+    assert [todo["id"] for todo in client.get("/todos/search", params = {"q": "plants"}).json()] == [1]
+
+    client.delete("/todos/todo/1")
+    assert client.get("/todos/search", params = {"q": "plants"}).json() == []
+
+def test_search_paginated(test_todo):
+    add_todos([1, 2, 3, 4, 5])
+
+    ids = []
+    params = {"q": "paginated", "limit": 2, "fields": "id"}
+    while True:
+        response = client.get("/todos/search", params = params)
+        ids += [todo["id"] for todo in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert sorted(ids) == [2, 3, 4, 5, 6] and len(ids) == 5
+
+    # cursor belongs to one search, it can not be used with other query
+    response = client.get("/todos/search", params = {"q": "todo", "cursor": params["cursor"]})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid Cursor"}
+
+# Stats counters follow every write endpoint, no need to count todos on read.
+def test_stats_follow_writes():
+    def stats():
+        response = client.get("/todos/stats")
+        assert response.status_code == 200
+        return response.json()
+
+    assert stats() == {"total": 0, "completed": 0, "by_priority": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0}}
+
+    client.post("/todos/todo", json = {"title": "First", "description": "First todo", "priority": 2, "complete": False})
+    client.post("/todos/batch", json = [{"title": "Second", "description": "Second todo", "priority": 5, "complete": True},
+                                        {"title": "Third", "description": "Third todo", "priority": 5, "complete": False}])
+    assert stats() == {"total": 3, "completed": 1, "by_priority": {"1": 0, "2": 1, "3": 0, "4": 0, "5": 2}}
+
+    client.put("/todos/todo/1", json = {"title": "First", "description": "First todo", "priority": 4, "complete": True})
+    client.put("/todos/batch", json = [{"id": 3, "title": "Third", "description": "Third todo", "priority": 1, "complete": True}])
+    assert stats() == {"total": 3, "completed": 3, "by_priority": {"1": 1, "2": 0, "3": 0, "4": 1, "5": 1}}
+
+    client.delete("/todos/todo/1")
+    client.post("/todos/batch/delete", json = [2, 999])
+    assert stats() == {"total": 1, "completed": 1, "by_priority": {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0}}
+
+    with engine.connect() as connection:
+        connection.execute(text("DELETE from todos"))
+        connection.execute(text("DELETE from todo_stats"))
+        connection.commit()
+
+# pages take the user from the access_token cookie of the browser, without Authorization header, so no user override here
+def test_pages_with_cookie(test_todo, monkeypatch):
+    monkeypatch.delitem(app.dependency_overrides, get_current_user)
+    token = create_access_token('codingwithckp', 1, 'admin', timedelta(minutes = 20))
+    for url in ("/todos/todo-page", "/todos/edit-todo-page/1"):
+        response = client.get(url, headers = {"Cookie": f"access_token={token}"}, follow_redirects = False)
+        assert response.status_code == status.HTTP_200_OK
+        assert 'Learn To Code' in response.text
+    assert client.get("/todos/todo-page", follow_redirects = False).status_code == status.HTTP_302_FOUND
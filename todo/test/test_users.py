@@ -31,4 +31,31 @@ def test_change_password_invalid_current_password(test_user):
 def test_phone_number_change_success(test_user):
     response = client.put("/user/phonenumber/(123)-123-1234")
 
-    assert response.status_code == status.HTTP_204_NO_CONTENT
\ No newline at end of file
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+def test_return_user_etag(test_user):
+    etag = client.get("/user").headers["ETag"]
+    assert client.get("/user", headers = {"If-None-Match": etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put("/user/phonenumber/(222)-222-2222")
+
+    response = client.get("/user", headers = {"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["phone_number"] == "(222)-222-2222"
+
+def test_return_user_does_not_expose_password(test_user):
+    response = client.get("/user")
+    assert "hashed_password" not in response.json()
+    assert "version" not in response.json()
+
+def test_return_user_sparse_fields(test_user):
+    response = client.get("/user", params = {"fields": "username,email"})
+    assert response.json() == {"username": "codingwithckp", "email": "codingwithckp@email.com"}
+
+    response = client.get("/user", params = {"fields": "hashed_password"})
+    assert response.status_code == 400
+
+def test_phone_number_change_user_not_found():
+    response = client.put("/user/phonenumber/(123)-123-1234")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "User Not Found"}
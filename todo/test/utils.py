@@ -5,13 +5,17 @@ and a testing user
 '''
 
 from sqlalchemy import create_engine, text
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, NullPool
 from sqlalchemy.orm import sessionmaker
-from ..database import Base
-from ..main import app
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database import Base, init_engine, dispose_engine
+from main import app
 from fastapi.testclient import TestClient
-from ..models import Todos, Users
-from ..routers.auth import bcrypt_context
+from models import Todos, Users
+from hashing import bcrypt_context
+from todo_cache import todo_cache
+from query_diagnostics import assert_num_queries as assert_engine_num_queries
+import asyncio
 import pytest
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
@@ -21,12 +25,18 @@ TestingSessionLocal = sessionmaker(autocommit = False, autoflush = False, bind =
 
 Base.metadata.create_all(bind=engine)
 
-def override_get_db():
-    db = TestingSessionLocal()
+# Routers use async session, so app gets async session on the same sqlite file. Sync 'TestingSessionLocal' above is still
+# used by fixtures and tests to insert and check data. NullPool - every TestClient request runs in it's own event loop,
+# so we do not keep aiosqlite connection alive between requests.
+async_engine = create_async_engine(url = "sqlite+aiosqlite:///./testdb.db", poolclass = NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind = async_engine, autoflush = False, expire_on_commit = False)
+
+async def override_get_db():
+    db = TestingAsyncSessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
         
 '''
 This function replace current user with below mentioned user which is having admin privileges and will help in testing endpoints
@@ -36,6 +46,13 @@ def override_get_current_user():
 
 client = TestClient(app)
 
+# fixtures below insert and delete rows directly in database (not through endpoints), so cached todo lists
+# must be cleared before every test, otherwise one test can see todos cached by previous test.
+@pytest.fixture(autouse = True)
+def clear_todo_cache():
+    asyncio.run(todo_cache.clear())
+    yield
+
 '''
 How fixture works: 
 Think of pytest fixtures as test setup factories.
@@ -76,9 +93,25 @@ def test_todo():
 # or runs anything.
     with engine.connect() as connection:
         connection.execute(text("DELETE from todos"))
+        connection.execute(text("DELETE from todo_stats"))
         connection.commit()
 
 
+# app creates its engine only when it starts (lifespan), this fixture creates it on test database for tests which look
+# at the engine itself (pool stats), queries of other tests go through override_get_db.
+@pytest.fixture
+def app_engine():
+    yield init_engine("sqlite+aiosqlite:///./testdb.db")
+    asyncio.run(dispose_engine())
+
+
+# fixture to check how many SQL statements an endpoint runs, test fails if the number changes, so a new N+1 query or
+# an extra select before write is noticed in tests. Usage:  with assert_num_queries(2): client.get("/todos")
+@pytest.fixture
+def assert_num_queries():
+    return lambda expected: assert_engine_num_queries(async_engine, expected)
+
+
 # create fixture which will create a test user for testing endpoints of user.
 @pytest.fixture
 def test_user():
@@ -87,7 +120,7 @@ def test_user():
         email = "codingwithckp@email.com",
         first_name = "ckp",
         last_name = "pathak",
-        hashed_password = bcrypt_context.hash("testpassword"),
+        hashed_password = bcrypt_context().hash("testpassword"),
         role = "admin",
         phone_number = "(111)-111-1111"
     )
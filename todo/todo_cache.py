@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+'''
+Cache of each user's todo list.
+Users read their todo list much more often than they change it, so serialized list is kept in cache and
+GET /todos/ and todo page do not need to query database until user changes something.
+
+Invalidation: owner's version (users.version, check etag.py) is part of the cache key. Every endpoint which changes user's
+todos increases it in the same transaction, so after a write all old cached lists (all pages and filters) of that owner are
+never read again and simply expire or get evicted. Version is read from database on every request (one primary key lookup,
+the same one ETag needs), so a write done by one worker is seen by every other worker too, also with the in-memory backend.
+Version must be read before the todos and from the same database, then a list is never stored under a newer version than
+it has (for example a list read from a lagging replica is stored under the replica's older version).
+
+Backend is selected with TODO_CACHE_URL environment variable:
+    memory://                 - in-process cache (default), limited by TODO_CACHE_MAX_BYTES
+    redis://localhost:6379/0  - redis (or anything speaking redis protocol), shared by all workers
+'''
+
+TODO_CACHE_URL = os.getenv('TODO_CACHE_URL', 'memory://')
+TODO_CACHE_MAX_BYTES = int(os.getenv('TODO_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+TODO_CACHE_TTL = int(os.getenv('TODO_CACHE_TTL', '300'))
+
+class MemoryBackend:
+    '''
+    In-process LRU cache limited by total size of stored values, least recently used values are evicted first.
+    Values also expire after ttl, so lists of old versions do not take space for long.
+    '''
+
+    def __init__(self, max_bytes: int = TODO_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._values = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._values.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._values[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._values)))
+
+    def _remove(self, key: str):
+        entry = self._values.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    async def clear(self):
+        self._values.clear()
+        self.size = 0
+
+
+class RedisBackend:
+    '''
+    Backend for redis protocol servers, 'redis' package is imported only when this backend is used.
+    '''
+
+    def __init__(self, url: str = None, client = None):
+        if client is None:
+            import redis.asyncio
+            client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+
+    async def get(self, key: str):
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self.client.set(key, value, ex = ttl)
+
+    async def clear(self):
+        await self.client.flushdb()
+
+
+class TodoListCache:
+
+    def __init__(self, backend, ttl: int = TODO_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, owner_id, version, variant: str):
+        '''
+        version - owner's users.version, read before the todos. Owner without a users row has no version, then
+        nothing is cached (key is None) because nothing would invalidate it.
+        '''
+        if version is None:
+            return None
+        return f'todos:{owner_id}:{version}:{variant}'
+
+    async def get(self, key: str):
+        if key is None:
+            return None
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, data):
+        if key is not None:
+            await self.backend.set(key, json.dumps(data).encode(), self.ttl)
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+def build_backend(url: str = TODO_CACHE_URL):
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+todo_cache = TodoListCache(build_backend())
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+from fastapi import HTTPException
+
+'''
+Live todo changes for open todo pages, streamed with server-sent events from GET /todos/events.
+Endpoints which create/update/delete todos publish an event after commit, every open stream of the same owner gets it
+and base.js patches the list in place, no page reload and no polling.
+
+EventHub keeps the subscribers of this worker. Every subscriber has its own bounded queue, publisher never waits for
+a slow client: when queue of a subscriber is full, its pending events are dropped and it gets one 'resync' event instead,
+client then reloads the list once. Number of streams per owner is limited as well.
+
+With more than one worker, event published in one worker must reach streams in other workers too. That is the job of the
+backend, selected with TODO_EVENTS_URL environment variable:
+    memory://                 - only this worker (default, enough for one worker)
+    redis://localhost:6379/0  - redis pub/sub, every worker gets every event and delivers it to its own subscribers
+'''
+
+TODO_EVENTS_URL = os.getenv('TODO_EVENTS_URL', 'memory://')
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '100'))
+EVENT_MAX_STREAMS = int(os.getenv('EVENT_MAX_STREAMS', '10'))    # per owner and worker
+EVENT_HEARTBEAT = float(os.getenv('EVENT_HEARTBEAT', '15'))      # seconds, keeps proxies from closing idle stream
+REDIS_CHANNEL = 'todos:events'
+
+
+class Subscriber:
+
+    def __init__(self, owner_id, queue_size: int):
+        self.owner_id = owner_id
+        self.queue = asyncio.Queue(maxsize = queue_size)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # client is too slow, it will not get the missed events, so it has to reload the whole list
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.dropped += 1
+            self.queue.put_nowait({'type': 'resync'})
+
+    async def next(self, timeout: float):
+        '''
+        Next event, or None if nothing came within timeout.
+        '''
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBackend:
+    '''
+    Events stay in this worker.
+    '''
+
+    async def start(self, deliver):
+        self.deliver = deliver
+
+    async def publish(self, event: dict):
+        self.deliver(event)
+
+    async def stop(self):
+        pass
+
+
+class RedisBackend:
+    '''
+    Events go through redis pub/sub channel, so every worker (including this one) delivers them to its subscribers.
+    'redis' package is imported only when this backend is used.
+    '''
+
+    def __init__(self, url: str = None, client = None):
+        if client is None:
+            import redis.asyncio
+            client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.task = None
+
+    async def start(self, deliver):
+        self.deliver = deliver
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages = True)
+        await self.pubsub.subscribe(REDIS_CHANNEL)
+        self.task = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        async for message in self.pubsub.listen():
+            if message['type'] == 'message':
+                self.deliver(json.loads(message['data']))
+
+    async def publish(self, event: dict):
+        await self.client.publish(REDIS_CHANNEL, json.dumps(event))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            await self.pubsub.aclose()
+
+
+class EventHub:
+
+    def __init__(self, backend, queue_size: int = EVENT_QUEUE_SIZE, max_streams: int = EVENT_MAX_STREAMS):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self.subscribers = {} # owner_id -> set of Subscriber
+        self.started = False
+
+    async def start(self):
+        if not self.started:
+            await self.backend.start(self.deliver)
+            self.started = True
+
+    async def stop(self):
+        if self.started:
+            await self.backend.stop()
+            self.started = False
+
+    def check_room(self, owner_id):
+        if len(self.subscribers.get(owner_id, ())) >= self.max_streams:
+            raise HTTPException(status_code = 429, detail = 'Too Many Event Streams')
+
+    async def subscribe(self, owner_id) -> Subscriber:
+        await self.start()
+        self.check_room(owner_id)
+        subscriber = Subscriber(owner_id, self.queue_size)
+        self.subscribers.setdefault(owner_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.subscribers.get(subscriber.owner_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[subscriber.owner_id]
+
+    async def publish(self, owner_id, event_type: str, todos: list):
+        '''
+        Call only after db.commit(), so nobody sees a change which can still be rolled back.
+        'todos' are dicts, for 'deleted' events only ids are needed.
+        '''
+        if todos:
+            await self.start()
+            await self.backend.publish({'owner_id': owner_id, 'type': event_type, 'todos': todos})
+
+    def deliver(self, event: dict):
+        for subscriber in list(self.subscribers.get(event['owner_id'], ())):
+            subscriber.offer({'type': event['type'], 'todos': event['todos']})
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event.get('todos', []))}\n\n"
+
+
+async def event_stream(hub: EventHub, owner_id, request, heartbeat: float = EVENT_HEARTBEAT):
+    '''
+    Body of the SSE response, ends when client disconnects. Subscriber is made here and not in the endpoint, so it is
+    always removed by 'finally', a response whose body was never started (client went away before) leaves nothing behind.
+    '''
+    subscriber = None
+    try:
+        subscriber = await hub.subscribe(owner_id)
+        yield 'retry: 3000\n\n' # how long browser waits before reconnecting
+        while not await request.is_disconnected():
+            event = await subscriber.next(heartbeat)
+            yield format_event(event) if event is not None else ': ping\n\n'
+    finally:
+        if subscriber is not None:
+            hub.unsubscribe(subscriber)
+
+
+def build_backend(url: str = TODO_EVENTS_URL):
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+todo_events = EventHub(build_backend())
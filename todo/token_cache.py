@@ -0,0 +1,74 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+'''
+Cache of already verified JWT tokens.
+jwt.decode checks HMAC signature and parses claims on every request, but same client sends same token again and again
+until it expires. So after first successful decode we keep the user dict for that token (until token 'exp') and
+next requests with the same token skip the decode completely.
+Key is sha256 of the token, so raw tokens are not kept in memory.
+'''
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '300')) # upper limit in seconds, also used for tokens without 'exp'
+
+
+class TokenCache:
+    '''
+    Bounded LRU + TTL cache, least recently used token is removed when cache is full.
+    '''
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # token digest -> (user dict, expires at)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[0]) # copy, so caller can not change cached user
+
+    def put(self, token: str, user: dict, exp=None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        self._entries[key] = (dict(user), expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last = False)
+
+    def revoke(self, token: str) -> bool:
+        return self._entries.pop(self._key(token), None) is not None
+
+    def revoke_user(self, user_id) -> int:
+        keys = [key for key, (user, _) in self._entries.items() if user.get('id') == user_id]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+token_cache = TokenCache()